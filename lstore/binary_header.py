@@ -0,0 +1,60 @@
+import os
+import struct
+import zlib
+
+"""
+Fixed-layout binary headers: magic (4 bytes), format version, struct-packed fields, crc32 checksum of everything before it
+Used for the table and page range header files and embedded in segment files (see segment_file.py)
+"""
+
+class BinaryHeader():
+    CHECKSUM_FORMAT = struct.Struct(">I")
+
+    # fields_format is a struct format (without byte order) of the header's fields
+    def __init__(self, magic, version, fields_format):
+        self.magic = magic
+        self.version = version
+        self.struct = struct.Struct(">4sH" + fields_format)
+        self.size = self.struct.size + self.CHECKSUM_FORMAT.size
+
+    def pack(self, *fields):
+        data = self.struct.pack(self.magic, self.version, *fields)
+        return data + self.CHECKSUM_FORMAT.pack(zlib.crc32(data))
+
+    # Returns the header's fields, raises ValueError if data isn't a valid header
+    def unpack(self, data):
+        if len(data) < self.size:
+            raise ValueError("Header is truncated")
+
+        data = bytes(data[:self.size])
+        (checksum,) = self.CHECKSUM_FORMAT.unpack(data[self.struct.size:])
+        if zlib.crc32(data[:self.struct.size]) != checksum:
+            raise ValueError("Header checksum mismatch")
+
+        magic, version, *fields = self.struct.unpack(data[:self.struct.size])
+        if magic != self.magic:
+            raise ValueError(f"Header has the wrong magic {magic}")
+        if version != self.version:
+            raise ValueError(f"Header format version {version} isn't supported (expected {self.version})")
+        return fields
+
+    # Reads the header file's fields with a single read, None if the file doesn't exist
+    def read_file(self, file_path):
+        if not os.path.exists(file_path):
+            return None
+        with open(file_path, "rb") as f:
+            data = f.read(self.size)
+        try:
+            return self.unpack(data)
+        except ValueError as e:
+            raise ValueError(f"{file_path}: {e}")
+
+    # Written to a temporary file first so a crash never leaves half a header, sync=True fsyncs it before it replaces the old one
+    def write_file(self, file_path, *fields, sync=False):
+        temp_file_path = file_path + ".tmp"
+        with open(temp_file_path, "wb") as f:
+            f.write(self.pack(*fields))
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(temp_file_path, file_path)
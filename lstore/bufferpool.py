@@ -1,7 +1,14 @@
 from lstore.config import Config
-from collections import OrderedDict
 from lstore.logical_page import LogicalPage
+from lstore.physical_page import PhysicalPage
+from lstore.eviction_policy import create_eviction_policy
+from lstore.read_ahead import ReadAhead
+from lstore.bufferpool_stats import BufferpoolStats
 
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from time import perf_counter
+from itertools import zip_longest
 import threading
 
 """
@@ -11,126 +18,533 @@ TODO
 - Each frame stores logical page instead of physical page
 - Make sure bufferpool can be used for multiple tables at a time (use table_name)
 - params: know which logical page based on: table_name, page_range_index, record_type, logical_page_index
+
+The bufferpool is limited by Config.NUM_FRAMES frames, or by a memory budget in bytes when one is given
+(a frame's size grows with its table's number of columns, see Frame.num_bytes).
+Tables given a memory quota get their own partition of shards, other tables can't evict their frames and they can't evict other tables' frames.
 """
 
 class Bufferpool():
-    def __init__(self, disk):
+    # Parameters left at None use their Config setting (EVICTION_POLICY, NUM_BUFFERPOOL_SHARDS, BUFFERPOOL_MEMORY_BUDGET)
+    def __init__(self, disk, eviction_policy_type=None, num_shards=None, memory_budget=None, table_memory_quotas=None):
+        eviction_policy_type = Config.EVICTION_POLICY if eviction_policy_type is None else eviction_policy_type
+        num_shards = Config.NUM_BUFFERPOOL_SHARDS if num_shards is None else num_shards
+        memory_budget = Config.BUFFERPOOL_MEMORY_BUDGET if memory_budget is None else memory_budget
+
         self.disk = disk
-        self.page_table = OrderedDict()
-        self.frames = {} # Maps location (table_name, page_range_index, record_type, logical_page_index) to frame
-        self.frame_locks = {} # Maps location to frame lock
-        self.frame_locks_lock = threading.Lock() # Lock for the frame_locks
-        self.num_pinned = 0
-        
+        self.stats = BufferpoolStats() # Hit/miss/eviction/write-back counters and disk latencies
+        self.memory_budget = memory_budget # Bytes, None to limit the bufferpool to Config.NUM_FRAMES frames instead
+        table_memory_quotas = table_memory_quotas or {} # Maps table_name to the bytes reserved for its frames
+
+        # Frames are split into shards by location, each shard has its own latch, eviction policy and capacity
+        if memory_budget is None:
+            if table_memory_quotas:
+                raise ValueError("Table memory quotas need a bufferpool memory budget")
+            self.shared_shards = self.create_shards(eviction_policy_type, num_shards, max_frames=Config.NUM_FRAMES)
+        else:
+            shared_memory_budget = memory_budget - sum(table_memory_quotas.values()) # Quotas are carved out of the budget
+            if shared_memory_budget <= 0:
+                raise ValueError("Table memory quotas must add up to less than the bufferpool memory budget")
+            self.shared_shards = self.create_shards(eviction_policy_type, num_shards, max_bytes=shared_memory_budget)
+
+        self.table_partitions = {} # Maps table_name to the shards holding that table's frames (tables with a quota)
+        for table_name, memory_quota in table_memory_quotas.items():
+            self.table_partitions[table_name] = self.create_shards(eviction_policy_type, num_shards, max_bytes=memory_quota)
+
+        self.shards = self.shared_shards + [shard for shards in self.table_partitions.values() for shard in shards]
+
+        self.loads_in_flight = {} # Maps location to the Future of the thread loading it, other threads that miss on it wait for that frame
+        self.loads_in_flight_lock = threading.Lock()
+
+        # Background writer, writes dirty frames ahead of eviction once the dirty ratio reaches Config.DIRTY_RATIO_HIGH_WATERMARK
+        self.flusher_running = True
+        self.flusher_cond = threading.Condition()
+        self.flusher_thread = threading.Thread(target=self.__flush_in_background, daemon=True)
+        self.flusher_thread.start()
+
+        # Prefetches the next logical pages of sequential scans
+        self.read_ahead = ReadAhead(self) if Config.READ_AHEAD else None
+
+        # Preloads the working set saved by the last close (see warm_up)
+        self.warm_up_running = False
+        self.warm_up_thread = None
+
+    # Small capacities use fewer shards so each shard holds several frames (a pinned frame blocks fewer loads)
+    # The capacity left over by the split goes to the first shards, so the shards add up to max_frames (or max_bytes)
+    def create_shards(self, eviction_policy_type, num_shards, max_frames=None, max_bytes=None):
+        if max_frames is not None:
+            num_shards = max(1, min(num_shards, max_frames // Config.MIN_SHARD_FRAMES))
+            shard_frames, num_leftover_frames = divmod(max_frames, num_shards)
+            return [BufferpoolShard(eviction_policy_type, self.stats, max_frames=max(1, shard_frames + (shard_index < num_leftover_frames)))
+                    for shard_index in range(num_shards)]
+        num_shards = max(1, min(num_shards, max_bytes // Config.MIN_SHARD_MEMORY))
+        shard_bytes, num_leftover_bytes = divmod(max_bytes, num_shards)
+        return [BufferpoolShard(eviction_policy_type, self.stats, max_bytes=shard_bytes + (shard_index < num_leftover_bytes))
+                for shard_index in range(num_shards)]
+
+    def get_shard(self, location):
+        shards = self.table_partitions.get(location[0], self.shared_shards) # location[0] is the table_name
+        return shards[hash(location) % len(shards)]
+
+    # Returns every frame currently in the bufferpool
+    def get_frames(self):
+        frames = []
+        for shard in self.shards:
+            with shard.latch:
+                frames.extend(shard.frames.values())
+        return frames
     
-    def request_logical_page_frame(self, num_columns, table_name, page_range_index, record_type, logical_page_index):
-        """ Returns a page if its in memory, will load from disk if not. Returns the frame object """
+    def request_logical_page_frame(self, num_columns, table_name, page_range_index, record_type, logical_page_index, pin=False):
+        """ Returns a page if its in memory, will load from disk if not. Returns the frame object
+        With pin=True the frame is pinned before it's returned so it can't be evicted in between, the caller must unpin it """
         
         location = (table_name, page_range_index, record_type, logical_page_index)
+        return self.request_frame(self.get_shard(location), num_columns, location, pin)
 
-        if location in self.page_table:
-            self.page_table.move_to_end(location) # Maintains LRU
-            return self.frames[location]
-        
-        if len(self.frames) >= Config.NUM_FRAMES: # Checks if bufferpool is full
-            self.evict_frame()
-        
-        frame = self.load_frame_from_disk(num_columns, table_name, page_range_index, record_type, logical_page_index)
-         
+    # request_logical_page_frame for a caller that already has the location's shard
+    def request_frame(self, shard, num_columns, location, pin):
+        frame = shard.get_frame(location, pin, count_request=True)
+        if frame is None:
+            frame = self.install_frame_from_disk(shard, num_columns, location, pin)
+
+        if self.read_ahead is not None:
+            self.read_ahead.record_access(num_columns, frame)
+
+        return frame
+
+    def install_frame_from_disk(self, shard, num_columns, location, pin, create_if_missing=True):
+        """ Loads the location into the shard. Returns None if the logical page isn't on disk and create_if_missing is False
+        Concurrent misses on the same location are collapsed: the first thread does the I/O, the others wait for its frame """
+
+        while True:
+            with self.loads_in_flight_lock:
+                load = self.loads_in_flight.get(location)
+                is_loader = load is None
+                if is_loader:
+                    load = Future()
+                    self.loads_in_flight[location] = load
+
+            if is_loader:
+                break
+
+            # Another thread is loading the location, wait for its frame
+            frame = load.result() # Raises the loader's error
+            if frame is None and not create_if_missing:
+                return None
+            frame = shard.get_frame(location, pin)
+            if frame is not None:
+                return frame
+            # Evicted already (or the loader didn't create a missing page), try again
+
+        try:
+            frame = self.load_and_add_frame(shard, num_columns, location, pin, create_if_missing)
+        except Exception as e:
+            with self.loads_in_flight_lock:
+                del self.loads_in_flight[location]
+            load.set_exception(e)
+            raise
+
+        with self.loads_in_flight_lock:
+            del self.loads_in_flight[location]
+        load.set_result(frame)
+        return frame
+
+    # Only called by the thread loading the location
+    def load_and_add_frame(self, shard, num_columns, location, pin, create_if_missing):
+        # The location may have been added since this thread missed on it
+        frame = shard.get_frame(location, pin)
+        if frame is not None:
+            return frame
+
+        frame = self.load_frame_from_disk(num_columns, *location, create_if_missing=create_if_missing)
+        if frame is None:
+            return None
         if frame.logical_page.num_records==0:
             frame.dirty=True
+
+        with shard.latch:
+            self.make_room(shard, frame)
+            shard.add_frame(frame)
+            if pin:
+                shard.pin(frame)
+
         return frame
-       
-    def load_frame_from_disk(self, num_columns, table_name, page_range_index, record_type, logical_page_index):
-        """ Loads page from disk into memory. """
 
-        location = (table_name, page_range_index, record_type, logical_page_index)
+    '''
+    Evicts frames until the shard has room for the frame (caller holds the shard latch)
+    When every frame is pinned it waits for an unpin, pins are usually short (a query, the background writer, read-ahead).
+    It fails if none comes within Config.PIN_WAIT_TIMEOUT. Memory budgets are soft limits instead, the shard goes over budget until frames are unpinned
+    '''
+    def make_room(self, shard, frame):
+        deadline = None
+        while shard.frames and shard.is_full(frame):
+            try:
+                self.evict_frame(shard)
+            except RuntimeError:
+                if shard.max_frames is None:
+                    return
+                if deadline is None:
+                    deadline = perf_counter() + Config.PIN_WAIT_TIMEOUT
+                remaining_seconds = deadline - perf_counter()
+                if remaining_seconds <= 0:
+                    raise
+                shard.num_unpin_waiters += 1
+                try:
+                    shard.unpinned.wait(remaining_seconds) # Releases the latch while waiting
+                finally:
+                    shard.num_unpin_waiters -= 1
 
-        with self.frame_locks_lock:
-            if location not in self.frame_locks:
-                self.frame_locks[location] = threading.Lock()
+    # Used by read-ahead, loads a logical page that exists on disk (and the given columns) if it's not in memory yet
+    def prefetch_logical_page_frame(self, num_columns, location, column_indexes):
+        shard = self.get_shard(location)
+        if shard.has_frame(location):
+            return
+
+        try:
+            frame = self.install_frame_from_disk(shard, num_columns, location, pin=True, create_if_missing=False)
+        except RuntimeError: # Every frame in the shard is pinned, skip prefetching
+            return
+        if frame is None:
+            return
+
+        try:
+            for column_index in column_indexes:
+                frame.logical_page.get_physical_page(column_index)
+        finally:
+            self.unpin_frame(frame, shard)
 
-        frame_lock = self.frame_locks[location]
-        with frame_lock:
-            logical_page = self.disk.read_logical_page(table_name, page_range_index, record_type, logical_page_index)        
+    @contextmanager
+    def pinned(self, num_columns, table_name, page_range_index, record_type, logical_page_index):
+        """ Pins the logical page's frame for the duration of the with block
+        with bufferpool.pinned(num_columns, table_name, page_range_index, record_type, logical_page_index) as frame: """
+        location = (table_name, page_range_index, record_type, logical_page_index)
+        shard = self.get_shard(location)
+        frame = self.request_frame(shard, num_columns, location, pin=True)
+        try:
+            yield frame
+        finally:
+            self.unpin_frame(frame, shard)
+       
+    def load_frame_from_disk(self, num_columns, table_name, page_range_index, record_type, logical_page_index, create_if_missing=True):
+        """ Loads page from disk into memory (caller is the location's loader). Returns a frame that isn't in the bufferpool yet """
+
+        start_time = perf_counter()
+        logical_page = self.disk.read_logical_page(table_name, page_range_index, record_type, logical_page_index)
+        self.stats.record_disk_read(perf_counter() - start_time)
             
         if logical_page is None: # Creates new logical page if DNE
+            if not create_if_missing:
+                return None
             logical_page = LogicalPage(num_columns)
+        elif logical_page.physical_page_loader is not None: # Lazily loaded columns are disk reads too
+            physical_page_loader = self.stats.timed_disk_read(logical_page.physical_page_loader)
+
+            # The frame grows by a page every time one of its columns is loaded
+            def load_physical_page(column_index):
+                physical_page = physical_page_loader(column_index)
+                self.add_frame_bytes(frame, PhysicalPage.PAGE_SIZE)
+                return physical_page
+            logical_page.physical_page_loader = load_physical_page
 
         frame = Frame(logical_page, (table_name, page_range_index, record_type, logical_page_index))
-        #page_id = (table_name,page_range_index,logical_page_index)
-        self.frames[frame.location] = frame
-        self.page_table[frame.location] = frame  # Add to LRU tracking
         return frame
 
-    def evict_frame(self):
-        """ Removes LRU logical page from memory """
+    def add_frame_bytes(self, frame, num_bytes):
+        shard = self.get_shard(frame.location)
+        with shard.latch:
+            frame.num_bytes += num_bytes
+            if shard.frames.get(frame.location) is not frame: # Not added to the shard yet, counted when it's added
+                return
+            shard.num_bytes += num_bytes
+
+            # Evicts other frames if the loaded column took the shard over its memory budget
+            try:
+                while shard.is_over_capacity():
+                    self.evict_frame(shard)
+            except RuntimeError: # Every frame is pinned, the shard stays over budget until they're unpinned
+                pass
+
+    def evict_frame(self, shard):
+        """ Removes the logical page chosen by the shard's eviction policy from memory (caller holds the shard latch) """
 
-        if self.num_pinned == Config.NUM_FRAMES:
+        location = shard.eviction_policy.choose_victim() # Never a pinned frame
+        if location is None:
             raise RuntimeError("ALL FRAMES PINNED CANNOT EVICT")
 
-        for location, frame in self.page_table.items(): #Find unpinned pages
-            if not frame.pinned:
-                if frame.dirty:
-                    self.write_back_frame(frame)
+        # Written back before it's removed so a thread loading this location can't read the old data from disk
+        frame = shard.frames[location]
+        if frame.dirty:
+            self.write_back_frame(frame)
+            self.wake_flusher() # The background writer is behind, evictions shouldn't have to write
 
-                self.page_table.pop(location)
-                self.frames.pop(location)
-                return
+        shard.remove_frame(location)
+        shard.stats.record_eviction()
 
     def write_back_frame(self, frame):
-        """ writes dirty page back to disk. """
+        """ writes dirty page back to disk (caller holds the latch of the frame's shard or has the frame pinned and holds its write_lock). """
         if not frame.dirty:
             return
-        
-        # page_id = (table_name,page_range_index, record_type, logical_page_index)
-        #if frame.location in self.frames:
-            #logical_page = self.frames[frame.location].logical_page
 
         table_name, page_range_index, record_type, logical_page_index = frame.location
 
-        frame_lock = self.frame_locks[frame.location]
-        with frame_lock:
-            self.disk.write_logical_page(table_name, page_range_index, record_type, logical_page_index, frame.logical_page)
-        #self.frames[frame.location].dirty = False #clean
-        
+        # Cleared before writing, changes made during the write set it again (they set dirty after changing the page)
+        # Only the changed parts of the columns are written (see LogicalPage.mark_dirty)
         frame.dirty = False
+        dirty_ranges = frame.logical_page.take_dirty_ranges()
+        start_time = perf_counter()
+        try:
+            num_bytes_written = self.disk.write_logical_page(table_name, page_range_index, record_type, logical_page_index, frame.logical_page, dirty_ranges)
+        except Exception:
+            frame.logical_page.restore_dirty_ranges(dirty_ranges)
+            frame.dirty = True
+            raise
+        self.stats.record_disk_write(perf_counter() - start_time, num_bytes_written)
 
-    # Write back all dirty pages (called when closing the db and saving to disk)
-    def write_back_all_dirty_frames(self):
-        for location, frame in self.frames.items():
-            if frame.dirty:
+    # Writes a frame back without holding its shard latch, other threads can keep using the frame meanwhile
+    def flush_frame(self, frame):
+        shard = self.get_shard(frame.location)
+        with shard.latch:
+            if shard.frames.get(frame.location) is not frame: # Already evicted (and written back), the location may hold a reloaded frame
+                return
+            shard.pin(frame) # Can't be evicted while it's written
+
+        try:
+            with frame.write_lock:
                 self.write_back_frame(frame)
-                # table_name, page_range_index,record_type, logical_page_index = location
-                # self.disk.write_logical_page(table_name, page_range_index, record_type, logical_page_index, frame.logical_page) #uses stored location modifying the logical page back to disk
-                # frame.dirty = False
+        finally:
+            self.unpin_frame(frame, shard)
 
-    def pin_frame(self, frame):
-        """ Prevents logical page from being evicted """
-        if frame.pinned:
+    '''
+    Write back all dirty pages (called when closing the db and by Database.checkpoint)
+    Frames are grouped by segment file (a page range's base or tail pages), the groups are written in parallel on
+    Config.FLUSH_WORKERS threads and each segment file is fsynced once after all of its frames are written
+    '''
+    def write_back_all_dirty_frames(self):
+        segment_frames = {} # Maps (table_name, page_range_index, record_type) to its dirty frames
+        for frame in self.get_dirty_frames():
+            table_name, page_range_index, record_type, _ = frame.location
+            segment_frames.setdefault((table_name, page_range_index, record_type), []).append(frame)
+
+        with ThreadPoolExecutor(max_workers=Config.FLUSH_WORKERS, thread_name_prefix="flush") as executor:
+            list(executor.map(self.write_back_segment_frames, segment_frames.items())) # list() raises the workers' errors
+
+    def write_back_segment_frames(self, segment_frames):
+        (table_name, page_range_index, record_type), frames = segment_frames
+        for frame in sorted(frames, key=lambda frame: frame.location[3]): # In file order
+            self.flush_frame(frame)
+        self.disk.sync_segment_file(table_name, page_range_index, record_type)
+
+    # Returns (location, num_columns, column_indexes) of every frame, hottest first (saved at close so the next open can warm up)
+    def get_working_set(self):
+        shard_working_sets = []
+        for shard in self.shards:
+            with shard.latch:
+                shard_working_sets.append([
+                    (location, shard.frames[location].logical_page.num_columns, shard.frames[location].get_loaded_column_indexes())
+                    for location in shard.eviction_policy.get_locations_by_recency()
+                ])
+
+        # Interleaves the shards so every shard's hottest frames come first
+        working_set = []
+        for entries in zip_longest(*shard_working_sets):
+            working_set.extend(entry for entry in entries if entry is not None)
+        return working_set
+
+    def warm_up(self, working_set, max_frames=None):
+        """ Loads the working set's logical pages (and their columns) on a background thread, hottest first in the list
+        max_frames caps the number of frames loaded, None uses Config.WARM_UP_MAX_FRAMES (None there loads the whole working set) """
+        if max_frames is None:
+            max_frames = Config.WARM_UP_MAX_FRAMES
+        if max_frames is not None:
+            working_set = working_set[:max_frames]
+        if not working_set:
             return
 
-        if self.num_pinned >= Config.NUM_FRAMES:
-            raise RuntimeError("MAXED PINS. CANNOT PIN MORE")
-    
-        if not frame.pinned:
-            frame.pinned = True
+        self.warm_up_running = True
+        self.warm_up_thread = threading.Thread(target=self.__warm_up_in_background, args=(working_set,), daemon=True)
+        self.warm_up_thread.start()
+
+    # Returns the bufferpool's counters and latency histograms as a python dict, reset=True starts counting again from 0
+    def get_stats(self, reset=False):
+        stats = self.stats.to_dict()
+        stats["num_frames"] = sum(len(shard.frames) for shard in self.shards)
+        stats["num_bytes"] = sum(shard.num_bytes for shard in self.shards)
+        stats["memory_budget"] = self.memory_budget
+        stats["num_dirty_frames"] = len(self.get_dirty_frames())
+        if reset:
+            self.stats.reset()
+        return stats
+
+    def get_dirty_frames(self):
+        return [frame for frame in self.get_frames() if frame.dirty]
+
+    def get_dirty_ratio(self):
+        return sum(self.get_dirty_share(frame) for frame in self.get_dirty_frames())
+
+    # Share of the bufferpool's capacity used by the frame
+    def get_dirty_share(self, frame):
+        if self.memory_budget is None:
+            return 1 / Config.NUM_FRAMES
+        return frame.num_bytes / self.memory_budget
+
+    def wake_flusher(self):
+        with self.flusher_cond:
+            self.flusher_cond.notify()
+
+    def stop_flusher(self):
+        with self.flusher_cond:
+            self.flusher_running = False
+            self.flusher_cond.notify()
+        self.flusher_thread.join()
+
+    # Stops the background writer, read-ahead and warm-up threads (called when closing the db)
+    def stop_background_threads(self):
+        self.warm_up_running = False
+        if self.warm_up_thread is not None:
+            self.warm_up_thread.join()
+        self.stop_flusher()
+        if self.read_ahead is not None:
+            self.read_ahead.stop()
+
+    '''
+    Background writer, checks the dirty ratio every Config.FLUSHER_INTERVAL seconds (or when woken up by an eviction that had to write)
+    Once it reaches the high watermark, dirty frames are written until the ratio is back at the low watermark
+    '''
+    def __flush_in_background(self):
+        while True:
+            with self.flusher_cond:
+                self.flusher_cond.wait(Config.FLUSHER_INTERVAL)
+                if not self.flusher_running:
+                    return
+
+            dirty_frames = self.get_dirty_frames()
+            dirty_ratio = sum(self.get_dirty_share(frame) for frame in dirty_frames)
+            if dirty_ratio < Config.DIRTY_RATIO_HIGH_WATERMARK:
+                continue
+
+            for frame in dirty_frames:
+                if dirty_ratio <= Config.DIRTY_RATIO_LOW_WATERMARK:
+                    break
+                if not self.flusher_running:
+                    return
+                try:
+                    self.flush_frame(frame)
+                except RuntimeError: # Shard has every frame pinned, try again next round
+                    pass
+                dirty_ratio -= self.get_dirty_share(frame)
+
+    def __warm_up_in_background(self, working_set):
+        # Coldest first, so the hottest frames end up as the most recently used ones
+        for location, num_columns, column_indexes in reversed(working_set):
+            if not self.warm_up_running:
+                return
+            try:
+                self.prefetch_logical_page_frame(num_columns, location, column_indexes)
+            except OSError: # The page changed on disk since the working set was saved, skip it
+                pass
+        self.warm_up_running = False
+
+    def pin_frame(self, frame):
+        """ Prevents logical page from being evicted, every pin_frame needs its own unpin_frame """
+        shard = self.get_shard(frame.location)
+        with shard.latch:
+            shard.pin(frame)
+
+    def unpin_frame(self, frame, shard=None):
+        """ allows logical page to be evicted once every pin is released (shard is the frame's shard if the caller already has it) """
+        if shard is None:
+            shard = self.get_shard(frame.location)
+        with shard.latch:
+            shard.unpin(frame)
+
+# Part of the bufferpool's frames, all fields are protected by the shard's latch
+class BufferpoolShard():
+    def __init__(self, eviction_policy_type, stats, max_frames=None, max_bytes=None):
+        self.latch = threading.Lock()
+        self.unpinned = threading.Condition(self.latch) # Notified when a frame's last pin is released
+        self.num_unpin_waiters = 0 # Threads waiting on unpinned for room in the shard
+        self.stats = stats.create_shard_stats(self.latch) # This shard's counters in the bufferpool's BufferpoolStats
+        self.max_frames = max_frames # Max number of frames in this shard, None if it's limited by bytes
+        self.max_bytes = max_bytes # Max memory of the frames in this shard, None if it's limited by frames
+        self.eviction_policy = create_eviction_policy(eviction_policy_type) # Decides which frame to evict
+        self.frames = {} # Maps location (table_name, page_range_index, record_type, logical_page_index) to frame
+        self.num_bytes = 0 # Memory of the frames in this shard
+        self.num_pinned = 0
+
+    # Checks if the shard has no room left for the frame
+    def is_full(self, frame):
+        if self.max_frames is not None:
+            return len(self.frames) >= self.max_frames
+        return self.num_bytes + frame.num_bytes > self.max_bytes
+
+    def is_over_capacity(self):
+        return self.max_bytes is not None and self.num_bytes > self.max_bytes
+
+    # Returns the frame at location (and records the access) or None if it's not in the shard
+    # count_request=True counts it as a hit or a miss (a request from outside the bufferpool)
+    def get_frame(self, location, pin=False, count_request=False):
+        with self.latch:
+            frame = self.frames.get(location)
+            if frame is not None:
+                self.eviction_policy.access(location)
+                if pin:
+                    self.pin(frame)
+            if count_request:
+                if frame is not None:
+                    self.stats.record_hit(location[0]) # location[0] is the table_name
+                else:
+                    self.stats.record_miss(location[0])
+            return frame
+
+    # The frame stays pinned until its pin count is back to 0
+    def pin(self, frame):
+        if frame.pin_count == 0:
+            if self.max_frames is not None and self.num_pinned >= self.max_frames:
+                raise RuntimeError("MAXED PINS. CANNOT PIN MORE")
             self.num_pinned += 1
+            self.eviction_policy.pin(frame.location)
+            self.stats.record_frame_pinned()
+        frame.pin_count += 1
 
-    def unpin_frame(self, frame):
-        """ allows logical page to be evicted"""
-        if frame.pinned:
-            frame.pinned = False
+    def unpin(self, frame):
+        if frame.pin_count == 0:
+            return
+        frame.pin_count -= 1
+        if frame.pin_count == 0:
             self.num_pinned -= 1
+            self.eviction_policy.unpin(frame.location)
+            self.stats.record_frame_unpinned()
+            if self.num_unpin_waiters:
+                self.unpinned.notify_all()
 
-    def unpin_all_frames(self): # for deadlocking 
-        for frame in self.frames.values():
-            self.unpin_frame(frame)
+    def has_frame(self, location):
+        with self.latch:
+            return location in self.frames
+
+    def add_frame(self, frame):
+        self.frames[frame.location] = frame
+        self.num_bytes += frame.num_bytes
+        self.eviction_policy.insert(frame.location)
+
+    def remove_frame(self, location):
+        self.eviction_policy.remove(location)
+        frame = self.frames.pop(location)
+        self.num_bytes -= frame.num_bytes
 
 # References a logical page
 class Frame():
     def __init__(self, logical_page, location):
         self.dirty = False
-        self.pinned = False
+        self.pin_count = 0 # Number of pins held on the frame, it can only be evicted at 0
+        self.write_lock = threading.Lock() # Only one thread flushes the frame at a time
         self.location = location # tuple: (table_name, page_range_index, record_type, logical_page_index)
         self.logical_page = logical_page # Holds the in-memory logical page
+        self.num_bytes = Config.FRAME_OVERHEAD_BYTES + len(logical_page.get_loaded_column_indexes()) * PhysicalPage.PAGE_SIZE # Memory used by the frame, grows as columns are loaded
+
+    @property
+    def pinned(self):
+        return self.pin_count > 0
+
+    # Columns of the logical page that are in memory (pages read from disk load their columns lazily)
+    def get_loaded_column_indexes(self):
+        return self.logical_page.get_loaded_column_indexes()
@@ -0,0 +1,150 @@
+from time import perf_counter
+import threading
+
+"""
+Counters and latency histograms for the bufferpool, read through Database.stats()
+
+Counters updated on every request (hits, misses, pins, evictions) are kept per shard in ShardStats,
+under the shard latch the request already holds, so requests to different shards never share a lock. to_dict() adds them up.
+"""
+
+class BufferpoolStats():
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.shard_stats = [] # ShardStats of every shard
+        self.reset()
+
+    # Returns the counters of a new shard, updated while holding its latch
+    def create_shard_stats(self, latch):
+        shard_stats = ShardStats(latch)
+        with self.lock:
+            self.shard_stats.append(shard_stats)
+        return shard_stats
+
+    def reset(self):
+        with self.lock:
+            self.dirty_write_backs = 0
+            self.bytes_written = 0
+            self.disk_read_latency = LatencyHistogram()
+            self.disk_write_latency = LatencyHistogram()
+            shard_stats_list = list(self.shard_stats)
+
+        for shard_stats in shard_stats_list:
+            with shard_stats.latch:
+                shard_stats.reset()
+
+    def record_disk_read(self, seconds):
+        with self.lock:
+            self.disk_read_latency.record(seconds)
+
+    def record_disk_write(self, seconds, num_bytes):
+        with self.lock:
+            self.dirty_write_backs += 1
+            self.bytes_written += num_bytes
+            self.disk_write_latency.record(seconds)
+
+    # Wraps a function that reads from disk so its calls are recorded in the disk read histogram
+    def timed_disk_read(self, read_function):
+        def timed_read_function(*args):
+            start_time = perf_counter()
+            result = read_function(*args)
+            self.record_disk_read(perf_counter() - start_time)
+            return result
+        return timed_read_function
+
+    # Returns a snapshot of every counter as a python dict
+    # pinned_high_watermark is the sum of the shards' high watermarks (at least the bufferpool's, shards can peak at different times)
+    def to_dict(self):
+        hits = {}
+        misses = {}
+        evictions = 0
+        num_pinned = 0
+        pinned_high_watermark = 0
+        with self.lock:
+            shard_stats_list = list(self.shard_stats)
+        for shard_stats in shard_stats_list:
+            with shard_stats.latch:
+                for table_name, num_hits in shard_stats.hits.items():
+                    hits[table_name] = hits.get(table_name, 0) + num_hits
+                for table_name, num_misses in shard_stats.misses.items():
+                    misses[table_name] = misses.get(table_name, 0) + num_misses
+                evictions += shard_stats.evictions
+                num_pinned += shard_stats.num_pinned
+                pinned_high_watermark += shard_stats.pinned_high_watermark
+
+        num_hits = sum(hits.values())
+        num_requests = num_hits + sum(misses.values())
+        with self.lock:
+            return {
+                "hits": hits,
+                "misses": misses,
+                "hit_ratio": num_hits / num_requests if num_requests else None,
+                "evictions": evictions,
+                "dirty_write_backs": self.dirty_write_backs,
+                "bytes_written": self.bytes_written,
+                "num_pinned": num_pinned,
+                "pinned_high_watermark": pinned_high_watermark,
+                "disk_read_latency": self.disk_read_latency.to_dict(),
+                "disk_write_latency": self.disk_write_latency.to_dict(),
+            }
+
+
+# Counters of one bufferpool shard, the caller holds the shard's latch
+class ShardStats():
+    def __init__(self, latch):
+        self.latch = latch
+        self.num_pinned = 0 # Frames pinned right now (not reset)
+        self.reset()
+
+    def reset(self):
+        self.hits = {} # Maps table_name to number of requests that found the frame in memory
+        self.misses = {} # Maps table_name to number of requests that had to load the frame
+        self.evictions = 0
+        self.pinned_high_watermark = self.num_pinned
+
+    def record_hit(self, table_name):
+        self.hits[table_name] = self.hits.get(table_name, 0) + 1
+
+    def record_miss(self, table_name):
+        self.misses[table_name] = self.misses.get(table_name, 0) + 1
+
+    def record_eviction(self):
+        self.evictions += 1
+
+    def record_frame_pinned(self):
+        self.num_pinned += 1
+        self.pinned_high_watermark = max(self.pinned_high_watermark, self.num_pinned)
+
+    def record_frame_unpinned(self):
+        self.num_pinned -= 1
+
+
+# Counts latencies in exponential buckets (upper bounds in milliseconds)
+class LatencyHistogram():
+    BUCKET_BOUNDS_MS = [0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000]
+
+    def __init__(self):
+        self.bucket_counts = [0] * (len(self.BUCKET_BOUNDS_MS) + 1) # Last bucket is everything above the last bound
+        self.count = 0
+        self.total_ms = 0
+        self.max_ms = 0
+
+    def record(self, seconds):
+        latency_ms = seconds * 1000
+        bucket_index = 0
+        while bucket_index < len(self.BUCKET_BOUNDS_MS) and latency_ms > self.BUCKET_BOUNDS_MS[bucket_index]:
+            bucket_index += 1
+        self.bucket_counts[bucket_index] += 1
+        self.count += 1
+        self.total_ms += latency_ms
+        self.max_ms = max(self.max_ms, latency_ms)
+
+    def to_dict(self):
+        buckets = {f"<={bound_ms}ms": bucket_count for bound_ms, bucket_count in zip(self.BUCKET_BOUNDS_MS, self.bucket_counts)}
+        buckets[f">{self.BUCKET_BOUNDS_MS[-1]}ms"] = self.bucket_counts[-1]
+        return {
+            "count": self.count,
+            "mean_ms": self.total_ms / self.count if self.count else None,
+            "max_ms": self.max_ms,
+            "buckets": buckets,
+        }
@@ -19,8 +19,56 @@ class Config:
     BASE_RECORD = 0
     TAIL_RECORD = 1
 
+    # Physical pages
+    NUMPY_PHYSICAL_PAGES = True # Access page data through an int64 numpy view (vectorized reads/writes) instead of per-value int.from_bytes
+    MMAP_PHYSICAL_PAGES = False # Back loaded pages with a memory-mapped segment file (zero-copy reads, copied on first write) instead of reading them into memory
+
     # Bufferpool
     NUM_FRAMES = 500
+    NUM_BUFFERPOOL_SHARDS = 16 # Each shard has its own latch and an equal part of NUM_FRAMES (or of the memory budget)
+    MIN_SHARD_FRAMES = 8 # NUM_FRAMES is split into fewer shards rather than shards with fewer frames than this
+    BUFFERPOOL_MEMORY_BUDGET = None # Bytes, when set the bufferpool is limited by its frames' memory instead of NUM_FRAMES
+    FRAME_OVERHEAD_BYTES = 512 # Estimated memory of a frame besides its physical pages
+    PIN_WAIT_TIMEOUT = 10 # Seconds a load waits for a pin to be released when every frame of its shard is pinned, then it fails
+    MIN_SHARD_MEMORY = 1 << 20 # Bytes, a memory budget is split into fewer shards rather than shards smaller than this
+
+    # Background writer (writes dirty frames ahead of eviction)
+    FLUSHER_INTERVAL = 1 # Seconds between dirty ratio checks
+    DIRTY_RATIO_HIGH_WATERMARK = 0.5 # Start writing once this share of NUM_FRAMES (or of the memory budget) is dirty
+    DIRTY_RATIO_LOW_WATERMARK = 0.2 # Stop writing once the dirty share is back down to this
+
+    # Checkpoint (Database.checkpoint and close)
+    FLUSH_WORKERS = 4 # Threads writing dirty frames (one page range's base or tail pages per task) and table metadata
+    FSYNC_ON_CHECKPOINT = True # fsync every written file once (segment files after all their frames are written)
+
+    # Read-ahead (prefetches logical pages for sequential scans, see read_ahead.py)
+    READ_AHEAD = True
+    READ_AHEAD_TRIGGER = 2 # Consecutive logical pages requested before prefetching starts
+    READ_AHEAD_PAGES = 4 # Number of logical pages prefetched ahead of the scan
+    READ_AHEAD_WORKERS = 4 # Background I/O threads
+
+    # Warm start (the bufferpool's working set is saved at close and preloaded in the background on open)
+    WARM_UP = True
+    WARM_UP_MAX_FRAMES = None # Max number of frames preloaded on open, None preloads the whole saved working set
+
+    # Eviction policies (picked per Database, see eviction_policy.py)
+    EVICTION_POLICY_LRU = 0
+    EVICTION_POLICY_CLOCK = 1
+    EVICTION_POLICY_2Q = 2 # Scan resistant, a large range scan doesn't evict the hot pages
+    EVICTION_POLICY = EVICTION_POLICY_2Q
+    TWO_QUEUE_IN_RATIO = 0.25 # Share of the shard's frames for 2Q's a1_in queue
+    TWO_QUEUE_OUT_RATIO = 0.5 # Share of the shard's frames remembered in 2Q's a1_out ghost queue
+
+    # Table loading
+    LAZY_TABLE_LOADING = True # Tables are read from disk on their first get_table instead of in Database.open
+    TABLE_LOAD_WORKERS = 4 # Tables read in parallel by Database.load_tables
+
+    # Page directory
+    PERSIST_PAGE_DIRECTORY = True # False skips writing page_directory.bin at close, it's rebuilt from the RID columns on open instead
+    PAGE_DIRECTORY_REBUILD_WORKERS = 4 # Page ranges scanned in parallel when rebuilding
+
+    # Index
+    HASH_KEY_INDEX = True # Primary key -> RID dict next to the key column's BTree (which is kept for range queries), key_to_rid reads it without locking
 
     # Merging
     NUM_UPDATES_FOR_MERGE = 1000000 # Our merge works, if you want to test it lower this number
@@ -6,40 +6,80 @@ from lstore.logical_page import LogicalPage
 from lstore.index import Index
 from lstore.disk import Disk
 
+from concurrent.futures import Future, ThreadPoolExecutor
 import os
+import threading
 
 class Database():
 
-    def __init__(self):
+    # eviction_policy_type picks the bufferpool's eviction policy (Config.EVICTION_POLICY_LRU, EVICTION_POLICY_CLOCK or EVICTION_POLICY_2Q)
+    # memory_budget limits the bufferpool in bytes instead of Config.NUM_FRAMES frames
+    # table_memory_quotas maps table_name to bytes of the budget reserved for that table, so other tables can't evict its frames
+    # warm_up_max_frames caps the number of frames preloaded on open from the working set saved at the last close
+    # Parameters left at None use their Config setting (EVICTION_POLICY, BUFFERPOOL_MEMORY_BUDGET, WARM_UP_MAX_FRAMES) as it is when the db is opened
+    def __init__(self, eviction_policy_type=None, memory_budget=None, table_memory_quotas=None, warm_up_max_frames=None):
         self.path = None
         self.disk = None
         self.bufferpool = None
-        self.tables = {}
+        self.eviction_policy_type = eviction_policy_type
+        self.memory_budget = memory_budget
+        self.table_memory_quotas = table_memory_quotas
+        self.warm_up_max_frames = warm_up_max_frames
+        self.tables = {} # Tables in memory
+        self.unloaded_table_names = set() # Tables on disk that haven't been read yet (see get_table)
+        self.table_loads = {} # Maps table name to the Future of the thread reading it, other threads asking for it wait for that table
+        self.tables_lock = threading.Lock()
 
     # Checks the given path. The path could either already contain a db or one must be created
     def open(self, path):
         self.path = path
         self.disk = Disk(path)
-        self.bufferpool = Bufferpool(self.disk)
+        self.bufferpool = Bufferpool(self.disk, self.eviction_policy_type, memory_budget=self.memory_budget, table_memory_quotas=self.table_memory_quotas)
 
-        # If disk dir exists, read it
+        # If disk dir exists, read it (tables are only read when they're first used)
+        self.tables = {}
         if os.path.exists(path):
-            self.tables = self.disk.read_db(self.bufferpool)
+            self.unloaded_table_names = set(self.disk.read_table_names())
+            if not Config.LAZY_TABLE_LOADING:
+                self.load_tables()
+            if Config.WARM_UP:
+                self.bufferpool.warm_up(self.disk.read_bufferpool_working_set(), self.warm_up_max_frames)
         # If not, create new disk dir
         else:
             os.makedirs(path, exist_ok=True)
-            self.tables = {}
+            self.unloaded_table_names = set()
 
     # Close the db, write memory to disk for durable storage
     def close(self):
         if not self.disk.path_exists():
            return
 
-        for table in self.tables.values():
-            self.disk.write_table_and_page_ranges_metadata(table)
-        
+        self.bufferpool.stop_background_threads()
+        self.checkpoint()
+        self.disk.write_bufferpool_working_set(self.bufferpool.get_working_set())
+        self.disk.close()
+
+    # Write all dirty pages and the tables' metadata (table and page range headers, page directory, index) to disk without closing the db
+    # Pages go first so the headers never count records that aren't on disk, tables are written in parallel
+    # Tables that were never read since open haven't changed, so they aren't written
+    def checkpoint(self):
+        if not self.disk.path_exists():
+           return
+
         self.bufferpool.write_back_all_dirty_frames()
 
+        with ThreadPoolExecutor(max_workers=Config.FLUSH_WORKERS) as executor:
+            list(executor.map(self.disk.write_table_and_page_ranges_metadata, list(self.tables.values()))) # list() raises the workers' errors
+
+    """
+    # Returns the bufferpool's stats (hits/misses per table, evictions, dirty write-backs, pinned high watermark, disk latency histograms)
+    :param reset: bool          #Start counting again from 0 after reading them
+    """
+    def stats(self, reset=False):
+        if self.bufferpool is None:
+            return None
+        return self.bufferpool.get_stats(reset)
+
     """
     # Creates a new table
     :param name: string         #Table name
@@ -50,11 +90,13 @@ class Database():
         # if not self.disk.path_exists():
         #     return None
         
-        if name in self.tables:
-            return self.tables[name]
+        existing_table = self.get_table(name)
+        if existing_table is not None:
+            return existing_table
 
         table = Table(name, num_columns, key_index, self.bufferpool)
-        self.tables[name] = table
+        with self.tables_lock:
+            self.tables[name] = table
         return table
 
     
@@ -66,15 +108,55 @@ class Database():
         # if not self.disk.path_exists():
         #     return
         
-        if name not in self.tables:
-            return
-        
-        del self.tables[name]
+        with self.tables_lock:
+            self.unloaded_table_names.discard(name)
+            self.tables.pop(name, None)
 
     
     """
     # Returns table with the passed name
     """
     def get_table(self, name):
-        return self.tables.get(name, None)
+        with self.tables_lock:
+            table = self.tables.get(name)
+            if table is not None or name not in self.unloaded_table_names:
+                return table
+
+            # First use of a table on disk, read it (concurrent calls for the same table wait for the first one)
+            load = self.table_loads.get(name)
+            is_loader = load is None
+            if is_loader:
+                load = Future()
+                self.table_loads[name] = load
+
+        if not is_loader:
+            return load.result() # Raises the loader's error
+
+        try:
+            table = self.disk.read_table(name, self.bufferpool)
+        except Exception as e:
+            with self.tables_lock:
+                del self.table_loads[name]
+            load.set_exception(e)
+            raise
+
+        with self.tables_lock:
+            del self.table_loads[name]
+            if name in self.unloaded_table_names: # Not dropped while it was read
+                self.unloaded_table_names.discard(name)
+                if table is not None:
+                    self.tables[name] = table
+        load.set_result(table)
+        return table
+
+    """
+    # Reads tables from disk in parallel on a thread pool (all tables that haven't been read yet if table_names is None)
+    """
+    def load_tables(self, table_names=None):
+        if table_names is None:
+            with self.tables_lock:
+                table_names = list(self.unloaded_table_names)
+
+        with ThreadPoolExecutor(max_workers=Config.TABLE_LOAD_WORKERS) as executor:
+            return list(executor.map(self.get_table, table_names))
     
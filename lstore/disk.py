@@ -3,29 +3,34 @@ from lstore.table import Table
 from lstore.page_range import PageRange
 from lstore.logical_page import LogicalPage
 from lstore.physical_page import PhysicalPage
+from lstore.segment_file import SegmentFile
+from lstore.binary_header import BinaryHeader
+from lstore.page_directory import PageDirectory
 
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 import os
 import json
 import pickle
+import shutil
 import threading
 
 class Disk():
+    TABLE_HEADER = BinaryHeader(b"LTBL", 1, "qqq") # key, num_columns, next_rid (the table's name is its dir's name)
+    PAGE_RANGE_HEADER = BinaryHeader(b"LPRG", 1, "IIQQQ") # page_range_index, num_columns, num_base_records, num_tail_records, num_updates
+    PAGE_DIRECTORY_HEADER = BinaryHeader(b"LPGD", 1, "QH") # num_rids, num_fields (followed by the raw locations array)
+
     def __init__(self, db_path):
         self.db_path = db_path
+        self.segment_files = {} # Maps segment file path to its open SegmentFile
+        self.segment_files_lock = threading.Lock()
     
-    # Read db from disk and return tables dict (table name => Table())
-    def read_db(self, bufferpool):
-        tables = {}
+    # Returns the names of the tables stored in the db (each table is a directory), tables are read with read_table
+    def read_table_names(self):
         if not os.path.exists(self.db_path):
-            return tables
-
-        # Iterate through each table directory and load table data
-        for table_name in os.listdir(self.db_path):
-            table_path = os.path.join(self.db_path, table_name)
-            if os.path.isdir(table_path):
-                table = self.read_table(table_name, bufferpool)
-                tables[table_name] = table
-        return tables
+            return []
+        return [table_name for table_name in os.listdir(self.db_path) if os.path.isdir(os.path.join(self.db_path, table_name))]
     
     # Write the given Table object's metadata to disk (next_rid, page_directory, index) and also its page range's 
     def write_table_and_page_ranges_metadata(self, table):
@@ -36,19 +41,14 @@ class Disk():
         table_path = os.path.join(self.db_path, table.name)
         os.makedirs(table_path, exist_ok=True)
 
-        table_header = {
-            "name": table.name,
-            "key": table.key,
-            "num_columns":table.num_columns,
-            "next_rid":table.next_rid
-        }
-        
-        # Save table header and page directory as pkl files
-        self.write_python_dict_as_file(table_path, table_header, "header.pkl")
-        self.write_python_dict_as_file(table_path, table.page_directory, "page_directory.pkl")
+        # Save table header and page directory as binary files
+        self.TABLE_HEADER.write_file(os.path.join(table_path, "header.bin"), table.key, table.num_columns, table.next_rid, sync=Config.FSYNC_ON_CHECKPOINT)
+        self.remove_legacy_header(table_path)
+        self.write_page_directory(table_path, table.page_directory)
         # write index pkl
         with open(os.path.join(table_path, "index.pkl"), "wb") as f:
             pickle.dump(table.index, f)
+            self.sync_file(f)
 
         # loop through page_ranges and headers
         page_ranges_path = os.path.join(table_path, "page_ranges")
@@ -57,16 +57,10 @@ class Disk():
             page_range_path = os.path.join(page_ranges_path, str(page_range_index))
             page_range: PageRange = table.page_ranges[page_range_index]
             
-            page_range_header = {
-                "table_name": table.name,
-                "page_range_index": page_range_index,
-                "num_columns": page_range.num_columns,
-                "num_base_records": page_range.num_base_records,
-                "num_tail_records": page_range.num_tail_records,
-                "num_updates":page_range.num_updates,
-            }
             os.makedirs(page_range_path, exist_ok=True)
-            self.write_python_dict_as_file(page_range_path, page_range_header, "header.pkl")
+            self.PAGE_RANGE_HEADER.write_file(os.path.join(page_range_path, "header.bin"), page_range_index, page_range.num_columns,
+                                              page_range.num_base_records, page_range.num_tail_records, page_range.num_updates, sync=Config.FSYNC_ON_CHECKPOINT)
+            self.remove_legacy_header(page_range_path)
                 
 
     #call? read_file_as_python_dict*** use for pkl NO index
@@ -82,11 +76,8 @@ class Disk():
         if not os.path.exists(table_path):
             return None
         
-        # Gets table_header and page_directory data
-        table_header = self.read_file_as_python_dict(table_path, "header.pkl")
-        page_directory = self.read_file_as_python_dict(table_path, "page_directory.pkl")
-        page_directory = {int(k): tuple(v) for k, v in page_directory.items()} # Convert to int: tuple
-        
+        # Gets table_header data
+        table_header = self.read_table_header(table_name, table_path)
 
         # Ensures that path to "index.pkl" exists - returns None if it does not, builds index_object if it does
         index_path = os.path.join(table_path, "index.pkl")
@@ -98,98 +89,269 @@ class Disk():
         # Builds table from data in table directory
         table = Table(table_header["name"], table_header["num_columns"], table_header["key"], bufferpool)
         table.next_rid = table_header["next_rid"]
-        table.page_directory = page_directory
         index.table = table
-        index.lock = threading.Lock()
+        index.build_key_rids()
         table.index = index
 
         # Fills table with page ranges stored in its directory
         page_ranges_path = os.path.join(table_path, "page_ranges") 
-        for page_range_index in sorted(os.listdir(page_ranges_path)):
+        for page_range_index in sorted(os.listdir(page_ranges_path), key=int): # Numeric order, table.page_ranges is indexed by page_range_index
             page_range_path = os.path.join(page_ranges_path, str(page_range_index))
-            page_range_header = self.read_file_as_python_dict(page_range_path, "header.pkl")
+            self.migrate_legacy_page_range(table_name, int(page_range_index), page_range_path)
+            page_range_header = self.read_page_range_header(table_name, page_range_path)
             page_range = PageRange(page_range_header["table_name"], page_range_header["page_range_index"], page_range_header["num_columns"], bufferpool)
             page_range.num_base_records = page_range_header["num_base_records"]
             page_range.num_tail_records = page_range_header["num_tail_records"]
             page_range.num_updates = page_range_header["num_updates"]
             table.page_ranges.append(page_range)
+
+        # Page directory is rebuilt from the page ranges' RID columns when it wasn't saved
+        table.page_directory = self.read_page_directory(table_path)
+        if table.page_directory is None:
+            table.page_directory = self.rebuild_page_directory(table)
         
         # Returns fully built table
         return table
 
-    # Read logical page from disk and return LogicalPage object
+    # Returns the table's header as a python dict, read from header.bin (or the legacy pickled json header.pkl)
+    def read_table_header(self, table_name, table_path):
+        header_fields = self.TABLE_HEADER.read_file(os.path.join(table_path, "header.bin"))
+        if header_fields is None:
+            return self.read_file_as_python_dict(table_path, "header.pkl")
+
+        key, num_columns, next_rid = header_fields
+        return {"name": table_name, "key": key, "num_columns": num_columns, "next_rid": next_rid}
+
+    # Returns the page range's header as a python dict, read from header.bin (or the legacy pickled json header.pkl)
+    def read_page_range_header(self, table_name, page_range_path):
+        header_fields = self.PAGE_RANGE_HEADER.read_file(os.path.join(page_range_path, "header.bin"))
+        if header_fields is None:
+            return self.read_file_as_python_dict(page_range_path, "header.pkl")
+
+        page_range_index, num_columns, num_base_records, num_tail_records, num_updates = header_fields
+        return {
+            "table_name": table_name,
+            "page_range_index": page_range_index,
+            "num_columns": num_columns,
+            "num_base_records": num_base_records,
+            "num_tail_records": num_tail_records,
+            "num_updates": num_updates,
+        }
+
+    # Writes the page directory's locations array as raw binary after its header, so it can be memory-mapped when it's read
+    # Without Config.PERSIST_PAGE_DIRECTORY nothing is written (and an old file is removed so it can't be read back stale)
+    def write_page_directory(self, table_path, page_directory):
+        page_directory_path = os.path.join(table_path, "page_directory.bin")
+        if not Config.PERSIST_PAGE_DIRECTORY:
+            if os.path.exists(page_directory_path):
+                os.remove(page_directory_path)
+            return
+        locations = page_directory.get_locations()
+
+        temp_page_directory_path = page_directory_path + ".tmp" # A crash never leaves half a page directory
+        with open(temp_page_directory_path, "wb") as f:
+            f.write(self.PAGE_DIRECTORY_HEADER.pack(len(locations), PageDirectory.NUM_FIELDS))
+            f.write(locations.tobytes())
+            self.sync_file(f)
+        os.replace(temp_page_directory_path, page_directory_path)
+
+        legacy_page_directory_path = os.path.join(table_path, "page_directory.pkl")
+        if os.path.exists(legacy_page_directory_path):
+            os.remove(legacy_page_directory_path)
+
+    # Returns the table's PageDirectory, its locations are memory-mapped (copy on write) from page_directory.bin
+    # None if it wasn't saved (see rebuild_page_directory)
+    def read_page_directory(self, table_path):
+        page_directory_path = os.path.join(table_path, "page_directory.bin")
+        header_fields = self.PAGE_DIRECTORY_HEADER.read_file(page_directory_path)
+        if header_fields is None: # Legacy pickled json dict
+            page_directory_dict = self.read_file_as_python_dict(table_path, "page_directory.pkl")
+            if page_directory_dict is None:
+                return None
+            return PageDirectory.from_dict({int(rid): tuple(location) for rid, location in page_directory_dict.items()})
+
+        num_rids, num_fields = header_fields
+        if num_rids == 0:
+            return PageDirectory()
+        locations = np.memmap(page_directory_path, dtype=PageDirectory.DTYPE, mode="c", offset=self.PAGE_DIRECTORY_HEADER.size, shape=(num_rids, num_fields))
+        return PageDirectory(locations)
+
+    '''
+    Rebuilds the table's page directory from the RID column of every logical page (read straight from the segment files, not through the bufferpool)
+    Page ranges are scanned in parallel, each logical page's RIDs are set with one vectorized assignment
+    Base records marked deleted (indirection 0) are left out, like delete_record removes them from the page directory
+    '''
+    def rebuild_page_directory(self, table):
+        page_directory = PageDirectory()
+        page_directory.grow(table.next_rid)
+
+        def rebuild_page_range(page_range):
+            for record_type in (Config.BASE_RECORD, Config.TAIL_RECORD):
+                segment_file = self.get_segment_file(table.name, page_range.page_range_index, record_type)
+                if segment_file is None:
+                    continue
+
+                logical_page_index = 0
+                num_records = segment_file.read_num_records(logical_page_index)
+                while num_records is not None:
+                    rids = segment_file.read_physical_page(logical_page_index, Config.RID_COLUMN, num_records).read_array()
+                    offset_indexes = np.arange(num_records)
+                    if record_type == Config.BASE_RECORD:
+                        indirection_rids = segment_file.read_physical_page(logical_page_index, Config.INDIRECTION_COLUMN, num_records).read_array()
+                        is_live = indirection_rids != 0
+                        rids, offset_indexes = rids[is_live], offset_indexes[is_live]
+                    page_directory.set_logical_page_locations(rids, page_range.page_range_index, record_type, logical_page_index, offset_indexes)
+
+                    logical_page_index += 1
+                    num_records = segment_file.read_num_records(logical_page_index)
+
+        with ThreadPoolExecutor(max_workers=Config.PAGE_DIRECTORY_REBUILD_WORKERS) as executor:
+            list(executor.map(rebuild_page_range, table.page_ranges)) # list() raises the workers' errors
+
+        return page_directory
+
+    # Removes a legacy header.pkl once its header.bin is written
+    def remove_legacy_header(self, path):
+        legacy_header_path = os.path.join(path, "header.pkl")
+        if os.path.exists(legacy_header_path):
+            os.remove(legacy_header_path)
+
+    # Returns the segment file holding the base or tail pages of a page range
+    # The file is created if it doesn't exist and num_columns is given, otherwise None is returned
+    def get_segment_file(self, table_name, page_range_index, record_type, num_columns=None):
+        segment_file_name = "base_pages.seg" if record_type == Config.BASE_RECORD else "tail_pages.seg"
+        page_range_path = os.path.join(self.db_path, table_name, "page_ranges", str(page_range_index))
+        segment_file_path = os.path.join(page_range_path, segment_file_name)
+
+        with self.segment_files_lock:
+            segment_file = self.segment_files.get(segment_file_path)
+            if segment_file is None:
+                segment_file = SegmentFile.open(segment_file_path)
+                if segment_file is None:
+                    if num_columns is None:
+                        return None
+                    os.makedirs(page_range_path, exist_ok=True)
+                    segment_file = SegmentFile.create(segment_file_path, record_type, num_columns)
+                self.segment_files[segment_file_path] = segment_file
+            return segment_file
+
+    # Read logical page from disk and return LogicalPage object, None if it was never written
+    # Only the header is read here, each physical page is read the first time its column is accessed
     def read_logical_page(self, table_name, page_range_index, record_type, logical_page_index):
-        logical_pages_dir = "base_pages" if record_type == Config.BASE_RECORD else "tail_pages"
-        logical_page_path = os.path.join(self.db_path, table_name, "page_ranges", str(page_range_index), logical_pages_dir, str(logical_page_index))
-        
-        # Should return None if logical page DNE
+        segment_file = self.get_segment_file(table_name, page_range_index, record_type)
+        if segment_file is None:
+            return None
+
+        num_records = segment_file.read_num_records(logical_page_index)
+        if num_records is None:
+            return None
+
+        logical_page = LogicalPage(segment_file.num_columns, lambda column_index: segment_file.read_physical_page(logical_page_index, column_index, num_records))
+        logical_page.num_records = num_records
+        return logical_page
+
+    # Write the given LogicalPage object to disk, returns the number of bytes written
+    # dirty_ranges maps column_index to the [start, end) offset indexes to write, None writes every loaded column
+    # (columns that were never loaded haven't changed since they were read from disk, so they are skipped)
+    def write_logical_page(self, table_name, page_range_index, record_type, logical_page_index, logical_page: LogicalPage, dirty_ranges=None):
+        if dirty_ranges is None:
+            dirty_ranges = {column_index: (0, PhysicalPage.MAX_RECORDS) for column_index in logical_page.get_loaded_column_indexes()}
+
+        segment_file = self.get_segment_file(table_name, page_range_index, record_type, logical_page.num_columns)
+        return segment_file.write_logical_page(logical_page_index, logical_page, dirty_ranges)
+
+    # fsyncs the segment file of a page range's base or tail pages (once its dirty frames are written, see Bufferpool.write_back_all_dirty_frames)
+    def sync_segment_file(self, table_name, page_range_index, record_type):
+        if not Config.FSYNC_ON_CHECKPOINT:
+            return
+        segment_file = self.get_segment_file(table_name, page_range_index, record_type)
+        if segment_file is not None:
+            segment_file.sync()
+
+    # fsyncs an open metadata file before it's closed
+    def sync_file(self, f):
+        if Config.FSYNC_ON_CHECKPOINT:
+            f.flush()
+            os.fsync(f.fileno())
+
+    # Closes the segment files' file descriptors (called when closing the db)
+    def close(self):
+        with self.segment_files_lock:
+            for segment_file in self.segment_files.values():
+                segment_file.close()
+            self.segment_files = {}
+
+    '''
+    Migration from the legacy layout, where every logical page was a directory (base_pages/<logical_page_index>)
+    with a header.pkl and a directory per physical page (physical_pages/<column_index>/header.pkl and physical_page.data)
+    The page range's logical pages are copied into its segment files, then the legacy directories are removed
+    '''
+    def migrate_legacy_page_range(self, table_name, page_range_index, page_range_path):
+        for record_type, logical_pages_dir in ((Config.BASE_RECORD, "base_pages"), (Config.TAIL_RECORD, "tail_pages")):
+            logical_pages_path = os.path.join(page_range_path, logical_pages_dir)
+            if not os.path.isdir(logical_pages_path):
+                continue
+
+            for logical_page_index in sorted(int(name) for name in os.listdir(logical_pages_path)):
+                logical_page = self.read_legacy_logical_page(os.path.join(logical_pages_path, str(logical_page_index)))
+                if logical_page is None:
+                    continue
+                for column_index in range(logical_page.num_columns): # Loads every column so they're all written
+                    logical_page.get_physical_page(column_index)
+                self.write_logical_page(table_name, page_range_index, record_type, logical_page_index, logical_page)
+
+            # fsynced even without Config.FSYNC_ON_CHECKPOINT, the legacy directory is the only other copy of the pages
+            segment_file = self.get_segment_file(table_name, page_range_index, record_type)
+            if segment_file is not None:
+                segment_file.sync()
+            shutil.rmtree(logical_pages_path) # Only once every logical page is on disk in the segment file
+
+    # Read a logical page stored in the legacy layout, None if it's incomplete
+    def read_legacy_logical_page(self, logical_page_path):
         if not os.path.exists(logical_page_path):
             return None
         
         # Gets header for logical page
         logical_page_header = self.read_file_as_python_dict(logical_page_path, "header.pkl")
         
-        # Builds logical page and subsequent physical pages 
-        logical_page = LogicalPage(logical_page_header["num_columns"])
-        logical_page.num_records = logical_page_header["num_records"]
-        
         physical_pages_path = os.path.join(logical_page_path, "physical_pages")
-        if not os.path.exists(physical_pages_path):
+        if not logical_page_header or not os.path.exists(physical_pages_path):
             return None
-        
-        physical_pages = []
-        for column_index in range(logical_page.num_columns):
-            physical_page_path = os.path.join(physical_pages_path, str(column_index))
-            if not os.path.isdir(physical_page_path):
-                continue
-            physical_page_data_path = os.path.join(physical_page_path, "physical_page.data")
-            
-            physical_page_header = self.read_file_as_python_dict(physical_page_path, "header.pkl")
-            if not physical_page_header:
-                return None
-            
-            if not os.path.exists(physical_page_data_path):
-                return None
-            with open(physical_page_data_path, "rb") as f:
-                physical_page_data = bytearray(f.read())
-            
-            physical_page = PhysicalPage()
-            physical_page.num_records = physical_page_header["num_records"]
-            physical_page.data = physical_page_data
 
-            physical_pages.append(physical_page)
-            
-        logical_page.physical_pages = physical_pages
+        # Builds logical page, its physical pages are loaded lazily
+        logical_page = LogicalPage(logical_page_header["num_columns"], lambda column_index: self.read_legacy_physical_page(physical_pages_path, column_index))
+        logical_page.num_records = logical_page_header["num_records"]
 
         return logical_page
 
-    # Write the given LogicalPage object to disk
-    def write_logical_page(self, table_name, page_range_index, record_type, logical_page_index, logical_page: LogicalPage):
-        logical_pages_dir = "base_pages" if record_type == Config.BASE_RECORD else "tail_pages"
-        logical_page_path = os.path.join(self.db_path, table_name, "page_ranges", str(page_range_index), logical_pages_dir, str(logical_page_index))
-        os.makedirs(logical_page_path, exist_ok=True)
+    # Read a single column's physical page from a legacy logical page's physical_pages dir and return PhysicalPage object
+    def read_legacy_physical_page(self, physical_pages_path, column_index):
+        physical_page_path = os.path.join(physical_pages_path, str(column_index))
+        physical_page_data_path = os.path.join(physical_page_path, "physical_page.data")
 
-        logical_page_header = {
-            "num_columns": logical_page.num_columns,
-            "num_records": logical_page.num_records,
-        }
-        self.write_python_dict_as_file(logical_page_path, logical_page_header, "header.pkl")
+        physical_page_header = self.read_file_as_python_dict(physical_page_path, "header.pkl")
+        if not physical_page_header or not os.path.exists(physical_page_data_path):
+            raise FileNotFoundError(f"Physical page {column_index} is missing in {physical_pages_path}")
 
-        physical_pages_path = os.path.join(logical_page_path, "physical_pages")
-        for column_index in range(logical_page.num_columns):
-            physical_page_path = os.path.join(physical_pages_path, str(column_index))
-            physical_page = logical_page.physical_pages[column_index]
+        with open(physical_page_data_path, "rb") as f:
+            physical_page_data = bytearray(f.read())
 
-            physical_page_header = {
-                "num_records": physical_page.num_records,
-            }
-            
-            os.makedirs(physical_page_path, exist_ok=True)
-            self.write_python_dict_as_file(physical_page_path, physical_page_header, "header.pkl")
+        physical_page = PhysicalPage()
+        physical_page.num_records = physical_page_header["num_records"]
+        physical_page.data = physical_page_data
+
+        return physical_page
+
+    # Saves the bufferpool's working set (list of (location, num_columns, column_indexes), hottest first) so the next open can preload it
+    def write_bufferpool_working_set(self, working_set):
+        self.write_python_dict_as_file(self.db_path, {"frames": working_set}, "bufferpool_working_set.pkl")
 
-            physical_page_data_path = os.path.join(physical_page_path, "physical_page.data")
-            with open(physical_page_data_path, "wb") as f:
-                f.write(physical_page.data)
+    # Returns the working set saved by the last close, empty list if there is none
+    def read_bufferpool_working_set(self):
+        working_set = self.read_file_as_python_dict(self.db_path, "bufferpool_working_set.pkl")
+        if working_set is None:
+            return []
+        return [(tuple(location), num_columns, column_indexes) for location, num_columns, column_indexes in working_set["frames"]] # json turns tuples into lists
 
     def insert_page_range(self, table_name, page_range_index):
         path = os.path.join(self.db_path, table_name, "page_ranges", str(page_range_index))
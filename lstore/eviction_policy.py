@@ -0,0 +1,209 @@
+from lstore.config import Config
+from collections import OrderedDict
+
+"""
+Eviction policies decide which frame the bufferpool evicts when it's full.
+Frames are identified by their location (table_name, page_range_index, record_type, logical_page_index).
+
+The bufferpool tells the policy when a frame is inserted, accessed, pinned, unpinned and removed.
+Pinned frames keep their place in the eviction order (pinning and unpinning don't reorder anything, frames are pinned on every
+page access) and choose_victim() skips them. The ring of CLOCK and the FIFO a1_in of 2Q keep their order.
+"""
+
+class EvictionPolicy():
+    def __init__(self):
+        self.pinned = set() # Locations of pinned frames (not evictable)
+
+    def insert(self, location):
+        """ A new (unpinned) frame was loaded into the bufferpool """
+        raise NotImplementedError
+
+    def access(self, location):
+        """ A frame already in the bufferpool was requested """
+        raise NotImplementedError
+
+    def remove(self, location):
+        """ A frame left the bufferpool """
+        raise NotImplementedError
+
+    def pin(self, location):
+        """ Frame can't be evicted until it's unpinned """
+        raise NotImplementedError
+
+    def unpin(self, location):
+        raise NotImplementedError
+
+    def choose_victim(self):
+        """ Returns the location of the frame to evict, None if every frame is pinned """
+        raise NotImplementedError
+
+    def get_locations_by_recency(self):
+        """ Returns the locations of the frames from the hottest to the coldest (pinned frames first, they're in use) """
+        raise NotImplementedError
+
+
+# Least recently used, the frames are kept in an OrderedDict from least to most recently used
+# Frames are pinned right after they're accessed, so pinned frames are near the end and choose_victim() rarely skips any
+class LRUEvictionPolicy(EvictionPolicy):
+    def __init__(self):
+        super().__init__()
+        self.recency = OrderedDict()
+
+    def insert(self, location):
+        self.recency[location] = None
+
+    def access(self, location):
+        if location in self.recency:
+            self.recency.move_to_end(location)
+
+    def remove(self, location):
+        self.recency.pop(location, None)
+        self.pinned.discard(location)
+
+    def pin(self, location):
+        self.pinned.add(location)
+
+    def unpin(self, location):
+        self.pinned.discard(location)
+
+    def choose_victim(self):
+        return next((location for location in self.recency if location not in self.pinned), None)
+
+    def get_locations_by_recency(self):
+        return list(self.pinned) + [location for location in reversed(self.recency) if location not in self.pinned]
+
+
+# CLOCK (second chance), frames sit in a ring with a reference bit and the hand clears bits until it finds a frame without one
+class ClockEvictionPolicy(EvictionPolicy):
+    def __init__(self):
+        super().__init__()
+        self.ring = [] # Slots hold a location or None if the slot is free
+        self.slots = {} # Maps location to its slot index in the ring
+        self.referenced = {} # Maps location to its reference bit
+        self.free_slots = []
+        self.hand = 0
+
+    def insert(self, location):
+        if self.free_slots:
+            slot_index = self.free_slots.pop()
+            self.ring[slot_index] = location
+        else:
+            slot_index = len(self.ring)
+            self.ring.append(location)
+        self.slots[location] = slot_index
+        self.referenced[location] = True
+
+    def access(self, location):
+        if location in self.referenced:
+            self.referenced[location] = True
+
+    def remove(self, location):
+        slot_index = self.slots.pop(location, None)
+        if slot_index is None:
+            return
+        self.ring[slot_index] = None
+        self.free_slots.append(slot_index)
+        del self.referenced[location]
+        self.pinned.discard(location)
+
+    def pin(self, location):
+        self.pinned.add(location)
+
+    def unpin(self, location):
+        self.pinned.discard(location)
+
+    def choose_victim(self):
+        # Two full sweeps: the first one can clear every reference bit, the second one then finds a victim
+        for _ in range(2 * len(self.ring)):
+            location = self.ring[self.hand]
+            self.hand = (self.hand + 1) % len(self.ring)
+
+            if location is None or location in self.pinned:
+                continue
+            if self.referenced[location]:
+                self.referenced[location] = False
+                continue
+            return location
+        return None
+
+    def get_locations_by_recency(self):
+        # Frames with their reference bit set were used since the hand last passed them
+        return sorted(self.referenced, key=lambda location: (location not in self.pinned, not self.referenced[location]))
+
+
+"""
+2Q (Johnson & Shasha), scan resistant:
+- a1_in: FIFO of frames seen once recently, a range scan only cycles through this queue
+- a1_out: ghost queue of locations evicted from a1_in (no frames, only remembers them)
+- am: LRU of hot frames, a frame gets here when it's requested again after it was evicted from a1_in
+The queue sizes are shares of the number of frames currently held (the bufferpool can be limited by frames or by bytes)
+"""
+class TwoQueueEvictionPolicy(EvictionPolicy):
+    def __init__(self):
+        super().__init__()
+        self.a1_in = OrderedDict()
+        self.a1_out = OrderedDict()
+        self.am = OrderedDict()
+
+    def insert(self, location):
+        if location in self.a1_out:
+            del self.a1_out[location]
+            self.am[location] = None
+        else:
+            self.a1_in[location] = None
+
+    def access(self, location):
+        if location in self.am:
+            self.am.move_to_end(location)
+        # Frames in a1_in aren't moved, repeated requests shortly after loading are usually the same operation
+
+    def remove(self, location):
+        self.a1_in.pop(location, None)
+        self.am.pop(location, None)
+        self.pinned.discard(location)
+
+    def pin(self, location):
+        self.pinned.add(location)
+
+    def unpin(self, location):
+        self.pinned.discard(location)
+
+    def choose_victim(self):
+        a1_in_capacity = max(1, int(self.get_num_frames() * Config.TWO_QUEUE_IN_RATIO))
+        if self.a1_in and (len(self.a1_in) >= a1_in_capacity or not self.am):
+            queues = (self.a1_in, self.am)
+        else:
+            queues = (self.am, self.a1_in)
+        # The other queue is used when every frame of the first one is pinned
+        for queue in queues:
+            location = next((location for location in queue if location not in self.pinned), None)
+            if location is None:
+                continue
+            if queue is self.a1_in:
+                self.remember_evicted(location)
+            return location
+        return None
+
+    # Adds a location evicted from a1_in to the ghost queue a1_out
+    def remember_evicted(self, location):
+        self.a1_out[location] = None
+        a1_out_capacity = max(1, int(self.get_num_frames() * Config.TWO_QUEUE_OUT_RATIO))
+        while len(self.a1_out) > a1_out_capacity:
+            self.a1_out.popitem(last=False)
+
+    def get_num_frames(self):
+        return len(self.a1_in) + len(self.am)
+
+    def get_locations_by_recency(self):
+        return list(self.pinned) + [location for queue in (self.am, self.a1_in) for location in reversed(queue) if location not in self.pinned]
+
+
+def create_eviction_policy(eviction_policy_type):
+    if eviction_policy_type == Config.EVICTION_POLICY_LRU:
+        return LRUEvictionPolicy()
+    elif eviction_policy_type == Config.EVICTION_POLICY_CLOCK:
+        return ClockEvictionPolicy()
+    elif eviction_policy_type == Config.EVICTION_POLICY_2Q:
+        return TwoQueueEvictionPolicy()
+    else:
+        raise ValueError("Unknown eviction policy")
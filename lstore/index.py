@@ -1,102 +1,198 @@
 """
 A data structure holding indices for various columns of a table. Key column should be indexed by default, other columns can be indexed through this object. Indices are usually B-Trees, but other data structures can be used as well.
 """
+from lstore.config import Config
+from lstore.read_write_latch import ReadWriteLatch
+from BTrees.LOBTree import LOBTree
+from BTrees.LLBTree import LLTreeSet
 from BTrees.OOBTree import OOBTree
+import numpy as np
 import pickle
-import threading
+
+"""
+Every column value is a 64-bit int, so each column's index is an integer-keyed LOBTree (no generic object comparisons).
+A value maps to its RIDs: a plain int while the value has a single RID (every primary key), an LLTreeSet of RIDs once it has more.
+Only the key column is indexed by default, create_index() indexes another column (inserts and updates then maintain it too).
+Columns without an index are searched by scanning their latest values.
+With Config.HASH_KEY_INDEX primary keys are also kept in a dict (key_rids) so key_to_rid is one lookup without a latch.
+Only writers (holding the key column's latch) change it, reads are safe with the GIL.
+
+Each column's tree has its own reader-writer latch: lookups on a column run in parallel, an insert or update only
+blocks lookups on the columns it changes (one column at a time).
+"""
 
 class Index:
+    MIN_VALUE = -(1 << 63)
+    MAX_VALUE = (1 << 63) - 1
 
     def __init__(self, table):
         self.table = table # Exclude when serializing
-        self.indices = [OOBTree() for _ in range(self.table.num_columns)]
-        self.lock = threading.Lock() # Lock for concurrent access to indices
+        self.indices = [None] * self.table.num_columns # None for columns without an index
+        self.indices[self.table.key] = LOBTree()
+        self.key_rids = {} if Config.HASH_KEY_INDEX else None # Maps primary key to RID, not pickled (rebuilt from the key column's tree)
+        self.column_latches = [ReadWriteLatch() for _ in range(self.table.num_columns)] # Not pickled
 
     """
     # Returns the rid of the record of the given key value. Returns -1 if not found.
     """
     def key_to_rid(self, key_column, key_value):
-        with self.lock:
-            rid_list = self.locate(key_column, key_value, locked=True)
-            if not rid_list:
-                return -1
-            return rid_list[0]
+        if self.key_rids is not None and key_column == self.table.key:
+            return self.key_rids.get(key_value, -1)
+        rid_list = self.locate(key_column, key_value)
+        if not rid_list:
+            return -1
+        return rid_list[0]
        
 
     """
     # returns the location of all records with the given value on column "column"
     """
 
-    def locate(self, column, value, locked=False):
-        if locked:
-            rid_list = self._locate(column, value)
+    def locate(self, column, value):
+        with self.column_latches[column].read():
+            index = self.indices[column]
+            if index is not None:
+                rid_list = []
+                rids = index.get(value)
+                if rids is not None:
+                    self.extend_rid_list(rid_list, rids)
+                return rid_list
+        return self.scan(column, value, value) # Outside the latch, scanning reads pages
+
+    # Adds the RIDs of one value (an int or an LLTreeSet) to rid_list
+    @staticmethod
+    def extend_rid_list(rid_list, rids):
+        if isinstance(rids, int):
+            rid_list.append(rids)
         else:
-            with self.lock:
-                rid_list = self._locate(column, value)
-        return rid_list
-        
-    # Helper function for locate
-    def _locate(self, column, value):
-        rid_list = []
-        if self.indices[column] is not None and value in self.indices[column]:
-            rid_list.extend(self.indices[column][value])
-            # for rid in self.indices[column][value]:
-            #     rid_list.append(self.indices[column][value])
-        return rid_list
+            rid_list.extend(rids)
 
     """
     # Returns the RIDs of all records with values in column "column" between "begin" and "end"
     """
 
     def locate_range(self, begin, end, column):
-        with self.lock:
-            rid_list = []
-            for value, rid in self.indices[column].items(begin, end): # Within the column it accesses all values based on the given range 
-                rid_list.extend(rid)
-            return rid_list
+        with self.column_latches[column].read():
+            index = self.indices[column]
+            if index is not None:
+                rid_list = []
+                begin = max(begin, self.MIN_VALUE) # The tree's keys can't be compared with ints outside of 64 bits
+                end = min(end, self.MAX_VALUE)
+                for rids in index.values(begin, end): # Within the column it accesses all values based on the given range 
+                    self.extend_rid_list(rid_list, rids)
+                return rid_list
+        return self.scan(column, begin, end)
+
+    # Returns the RIDs of the records with values in [begin, end] in a column without an index
+    def scan(self, column, begin, end):
+        if not isinstance(begin, int) or not isinstance(end, int):
+            return []
+        base_rids, values = self.table.get_latest_column_values(column)
+        return base_rids[(values >= begin) & (values <= end)].tolist()
 
 
     """
     # optional: Creates index on target column in the table. Searches for all RIDs mapping it's column values to their each RID later storing them 
     """
 
+    # Columns set to None aren't indexed (e.g. the columns an update doesn't change)
     def create_index_with_rid(self, rid, columns):
-        with self.lock:
-            for column_index, column_value in enumerate(columns):
-                if column_value not in self.indices[column_index]: # Creates new entries for values that aren't in the index
-                    self.indices[column_index][column_value] = []
-                self.indices[column_index][column_value].append(rid)
+        for column_index, column_value in enumerate(columns):
+            if column_value is None:
+                continue
+            with self.column_latches[column_index].write():
+                index = self.indices[column_index]
+                if index is None: # Not indexed, checked under the latch so an index create_index is building isn't missed
+                    continue
+                rids = index.get(column_value)
+                if rids is None: # Creates new entries for values that aren't in the index
+                    index[column_value] = rid
+                elif isinstance(rids, int): # Second RID of the value (the same RID again if create_index already found it)
+                    if rids != rid:
+                        index[column_value] = LLTreeSet((rids, rid))
+                else:
+                    rids.add(rid)
+
+                if column_index == self.table.key and self.key_rids is not None:
+                    self.key_rids[column_value] = rid
     
+    # Removes rid from the entries of the column values, other records with the same values stay indexed. Columns set to None are skipped
     def delete_index_entry(self, rid, columns):
-        with self.lock:
-            for column_index, column_value in enumerate(columns):
-                if column_value in self.indices[column_index]: # Deletes entries for values that is in the index
-                    del self.indices[column_index][column_value]
+        for column_index, column_value in enumerate(columns):
+            if column_value is None:
+                continue
+            with self.column_latches[column_index].write():
+                index = self.indices[column_index]
+                if index is None: # Not indexed, checked under the latch so an index create_index is building isn't missed
+                    continue
+                if column_index == self.table.key and self.key_rids is not None and self.key_rids.get(column_value) == rid:
+                    del self.key_rids[column_value]
+
+                rids = index.get(column_value)
+                if rids is None:
+                    continue
+                if isinstance(rids, int):
+                    if rids == rid: # Value's only RID
+                        del index[column_value]
+                    continue
+
+                rids.discard(rid)
+                if len(rids) == 1: # Back to a single RID
+                    index[column_value] = rids.minKey()
+                elif not rids:
+                    del index[column_value]
+
+    # Moves rid from the old values to the new values of the columns that changed (new value not None and different)
+    def update_index_entry(self, rid, old_columns, new_columns):
+        changed_column_indexes = [column_index for column_index, column_value in enumerate(new_columns)
+                                  if column_value is not None and column_value != old_columns[column_index]]
+        if not changed_column_indexes:
+            return
+
+        old_changed_columns = [None] * len(new_columns)
+        new_changed_columns = [None] * len(new_columns)
+        for column_index in changed_column_indexes:
+            old_changed_columns[column_index] = old_columns[column_index]
+            new_changed_columns[column_index] = new_columns[column_index]
+        self.delete_index_entry(rid, old_changed_columns)
+        self.create_index_with_rid(rid, new_changed_columns)
 
 
     def create_index(self, column):
         """ Creates an index for a specific column if it doesn't exist. """
-        return
-        # if self.indices[column] is None:
-        #     self.indices[column] = OOBTree()
-
-        # # Populate the index with existing records
-        # for rid, page_info in self.table.page_directory.items():
-        #     value = self.table.get_column_value_nonmeta(rid, column)  # gets column value
-
-        #     if value not in self.indices[column]:
-        #         self.indices[column][value] = set()  # initialize set for RIDs
-            
-        #     self.indices[column][value].append(rid)  # add rid to index
-            
-        
+        if self.indices[column] is not None:
+            return
+        # Built while holding the column's latch, inserts and updates wait for the index instead of missing it
+        with self.column_latches[column].write():
+            if self.indices[column] is not None: # Created meanwhile
+                return
+            base_rids, values = self.table.get_latest_column_values(column)
+            self.indices[column] = self.bulk_load(values, base_rids)
+
+    # Builds an index from the values and RIDs of every record, sorted first so the tree is loaded in key order
+    @staticmethod
+    def bulk_load(values, rids):
+        order = np.lexsort((rids, values))
+        values, rids = values[order], rids[order]
+        starts = np.flatnonzero(np.r_[True, values[1:] != values[:-1]]) if len(values) else np.empty(0, dtype=np.int64)
+        ends = np.r_[starts[1:], len(values)]
+
+        rid_list = rids.tolist()
+        items = [(value, rid_list[start] if end - start == 1 else LLTreeSet(rid_list[start:end]))
+                 for value, start, end in zip(values[starts].tolist(), starts.tolist(), ends.tolist())]
+        index = LOBTree()
+        index.update(items)
+        return index
+
     """
     # optional: Drop index of specific column
     """
 
     def drop_index(self, column):
-        return
-        # self.indices[column].clear()
+        if column == self.table.key:
+            raise ValueError("The key column's index can't be dropped")
+        with self.column_latches[column].write():
+            self.indices[column] = None # Frees the tree, the column is scanned from now on
 
     # ----------------------------------------------------------------
 
@@ -105,15 +201,60 @@ class Index:
         state = self.__dict__.copy()
         if 'table' in state:
             del state['table']  # Exclude the table reference from being serialized
-        if 'lock' in state:
-            del state['lock']  # Exclude the lock from being serialized
+        if 'column_latches' in state:
+            del state['column_latches']  # Exclude the latches from being serialized
+        if 'key_rids' in state:
+            del state['key_rids']  # Rebuilt by build_key_rids when the table is read
+        # Trees are pickled as flat (values, RIDs) lists, pickling a large BTree recurses once per bucket
+        flat_indices = []
+        for column_index in range(len(self.indices)):
+            with self.column_latches[column_index].read():
+                flat_indices.append(self.flatten_index(self.indices[column_index]))
+        state['indices'] = flat_indices
         return state
 
     def __setstate__(self, state):
         # Restore the state and set table to None (or handle as needed)
         self.__dict__.update(state)
         self.table = None  # Ensure table is None after deserialization
-        self.lock = None
+        self.indices = [self.unflatten_index(index) if isinstance(index, tuple) else self.convert_legacy_index(index) for index in self.indices]
+        self.column_latches = [ReadWriteLatch() for _ in self.indices]
+
+    # Builds the primary key dict from the key column's tree (once the table is set after reading the index from disk)
+    def build_key_rids(self):
+        if not Config.HASH_KEY_INDEX:
+            self.key_rids = None
+            return
+        key_index = self.indices[self.table.key]
+        self.key_rids = {key_value: rids if isinstance(rids, int) else rids.minKey() for key_value, rids in key_index.items()}
+
+    # Returns the index as (values, rids), rids[i] is an int or a list of the RIDs of values[i]
+    @staticmethod
+    def flatten_index(index):
+        if index is None:
+            return None
+        return (list(index.keys()), [rids if isinstance(rids, int) else list(rids) for rids in index.values()])
+
+    @staticmethod
+    def unflatten_index(flat_index):
+        values, rids = flat_index
+        index = LOBTree()
+        index.update(list(zip(values, [rid if isinstance(rid, int) else LLTreeSet(rid) for rid in rids])))
+        return index
+
+    # Indexes written before the integer trees are OOBTrees of RID lists
+    @staticmethod
+    def convert_legacy_index(index):
+        if not isinstance(index, OOBTree):
+            return index
+
+        converted_index = LOBTree()
+        for value, rid_list in index.items():
+            if len(rid_list) == 1:
+                converted_index[value] = rid_list[0]
+            elif rid_list:
+                converted_index[value] = LLTreeSet(rid_list)
+        return converted_index
 
 
  #################
@@ -1,24 +1,96 @@
 from lstore.config import Config
 from lstore.physical_page import PhysicalPage
 
+import threading
 
 # Represents either a base page or tail page (each set of columns), base/tail page is effectively a row
 class LogicalPage:
     
     # num_columns should include the meta-columns
-    def __init__(self, num_columns):
+    # physical_page_loader(column_index) is given when the page is on disk, its columns are then only loaded when first accessed
+    def __init__(self, num_columns, physical_page_loader=None):
         self.num_columns = num_columns
 
-        self.physical_pages = [PhysicalPage() for i in range(num_columns)] # the columns of a record
+        if physical_page_loader is None:
+            self.physical_pages = [PhysicalPage() for i in range(num_columns)] # the columns of a record
+        else:
+            self.physical_pages = [None] * num_columns # None until the column is loaded
+        self.physical_page_loader = physical_page_loader
+        self.physical_pages_lock = threading.Lock() # Makes sure a column is only loaded once
         self.num_records = 0
+
+        # Changed since the last write back, only those offsets are written to disk:
+        # dirty_ranges maps column_index to the [start, end) offset indexes updated in place,
+        # appended_range is the [start, end) offset indexes of the records appended (every column), None if there are none
+        # A new logical page was never written, so all of its pages are
+        self.dirty_ranges = {}
+        self.appended_range = None if physical_page_loader is not None else (0, PhysicalPage.MAX_RECORDS)
+        self.dirty_ranges_lock = threading.Lock()
+
+    # Returns the physical page of a column, loads it from disk on first access
+    def get_physical_page(self, column_index):
+        physical_page = self.physical_pages[column_index]
+        if physical_page is None:
+            with self.physical_pages_lock:
+                physical_page = self.physical_pages[column_index]
+                if physical_page is None:
+                    physical_page = self.physical_page_loader(column_index)
+                    self.physical_pages[column_index] = physical_page
+        return physical_page
+
+    def is_column_loaded(self, column_index):
+        return self.physical_pages[column_index] is not None
+
+    def get_loaded_column_indexes(self):
+        return [column_index for column_index in range(self.num_columns) if self.is_column_loaded(column_index)]
     
+    # Called after the change, so a write back that took the ranges before it doesn't miss it
+    def mark_dirty(self, column_indexes, start_offset_index, end_offset_index):
+        with self.dirty_ranges_lock:
+            for column_index in column_indexes:
+                dirty_range = self.dirty_ranges.get(column_index)
+                if dirty_range is not None:
+                    start_offset_index, end_offset_index = min(dirty_range[0], start_offset_index), max(dirty_range[1], end_offset_index)
+                self.dirty_ranges[column_index] = (start_offset_index, end_offset_index)
+
+    # mark_dirty for a record appended at offset_index, one range for every column
+    def mark_appended(self, offset_index):
+        with self.dirty_ranges_lock:
+            if self.appended_range is None:
+                self.appended_range = (offset_index, offset_index + 1)
+            elif offset_index >= self.appended_range[1]: # Records are appended in order
+                self.appended_range = (self.appended_range[0], offset_index + 1)
+
+    # Returns the dirty ranges of every column and clears them (called by the bufferpool when writing the page back)
+    def take_dirty_ranges(self):
+        with self.dirty_ranges_lock:
+            dirty_ranges = self.dirty_ranges
+            appended_range = self.appended_range
+            self.dirty_ranges = {}
+            self.appended_range = None
+
+        if appended_range is not None:
+            for column_index in range(self.num_columns):
+                dirty_range = dirty_ranges.get(column_index, appended_range)
+                dirty_ranges[column_index] = (min(dirty_range[0], appended_range[0]), max(dirty_range[1], appended_range[1]))
+        return dirty_ranges
+
+    # Puts back dirty ranges taken by a write back that failed
+    def restore_dirty_ranges(self, dirty_ranges):
+        for column_index, (start_offset_index, end_offset_index) in dirty_ranges.items():
+            self.mark_dirty([column_index], start_offset_index, end_offset_index)
+
     def has_capacity(self):
         return self.num_records < Config.MAX_RECORDS_PER_LOGICAL_PAGE
     
-    def read_record(self, offset_index):
+    # Only decodes the columns in column_indexes (all columns if None)
+    def read_record(self, offset_index, column_indexes=None):
+        if column_indexes is None:
+            column_indexes = range(self.num_columns)
+
         record = []
-        for physical_page in self.physical_pages:
-            column_value = physical_page.read(offset_index) # Can raise Error
+        for column_index in column_indexes:
+            column_value = self.get_physical_page(column_index).read(offset_index) # Can raise Error
             record.append(column_value)
 
         return record
@@ -28,9 +100,10 @@ class LogicalPage:
             raise Exception("Cannot write, this logical page is full")
 
         for i in range(self.num_columns):
-            physical_page = self.physical_pages[i]
+            physical_page = self.get_physical_page(i)
             offset_index = physical_page.create(columns[i]) # Can raise Error
         self.num_records += 1
+        self.mark_appended(offset_index)
 
         return offset_index
 
@@ -38,13 +111,22 @@ class LogicalPage:
     def update_record_value(self, offset_index, column_index, column_value):
         if offset_index >= self.num_records or offset_index < 0:
             raise IndexError("Invalid index updating the record")
-        self.physical_pages[column_index].update_value(offset_index, column_value)
+        self.get_physical_page(column_index).update_value(offset_index, column_value)
+        self.mark_dirty([column_index], offset_index, offset_index + 1)
+    
+    # Overwrites one column of consecutive records starting at offset_index in a single write (used by the merge)
+    def update_column_values(self, offset_index, column_index, column_values):
+        if offset_index < 0 or offset_index + len(column_values) > self.num_records:
+            raise IndexError("Invalid index updating the records")
+        self.get_physical_page(column_index).update_values(offset_index, column_values)
+        self.mark_dirty([column_index], offset_index, offset_index + len(column_values))
     
     # RID of 0 is reserved for indicating deletion
     def mark_to_delete_record(self, offset_index):
         if offset_index >= self.num_records or offset_index < 0:
             raise IndexError("Invalid index deleting the record")
-        self.physical_pages[Config.INDIRECTION_COLUMN].update_value(offset_index, 0) # Can raise Error
+        self.get_physical_page(Config.INDIRECTION_COLUMN).update_value(offset_index, 0) # Can raise Error
+        self.mark_dirty([Config.INDIRECTION_COLUMN], offset_index, offset_index + 1)
 
     '''
     Metadata Column Values
@@ -0,0 +1,86 @@
+import numpy as np
+import threading
+
+"""
+Page directory of a table, maps RID -> (page_range_index, record_type, logical_page_index, offset_index)
+
+RIDs are dense integers starting at 1, so locations are stored in an int32 array indexed by RID (16 bytes per RID)
+instead of a dict of tuples. RIDs that were never given out or were deleted hold a tombstone.
+Used like the dict it replaces: rid in page_directory, page_directory[rid], page_directory[rid] = location, del page_directory[rid]
+"""
+
+class PageDirectory():
+    TOMBSTONE = -1 # page_range_index of RIDs without a location
+    DTYPE = np.dtype("<i4")
+    NUM_FIELDS = 4 # page_range_index, record_type, logical_page_index, offset_index
+    INITIAL_CAPACITY = 1024
+
+    # locations is an existing (num_rids, NUM_FIELDS) array, e.g. memory-mapped from the page directory file
+    def __init__(self, locations=None):
+        self.size = len(locations) if locations is not None else 0 # Highest RID with a location + 1
+        if locations is None:
+            locations = self.create_locations(self.INITIAL_CAPACITY)
+        self.locations = locations
+        self.lock = threading.Lock() # Writers only, reads don't lock
+
+    def create_locations(self, capacity):
+        locations = np.empty((capacity, self.NUM_FIELDS), dtype=self.DTYPE)
+        locations[:, 0] = self.TOMBSTONE
+        return locations
+
+    def __contains__(self, rid):
+        locations = self.locations
+        return 0 <= rid < len(locations) and locations[rid, 0] != self.TOMBSTONE
+
+    def __getitem__(self, rid):
+        if rid not in self:
+            raise KeyError(rid)
+        return tuple(self.locations[rid].tolist())
+
+    def __setitem__(self, rid, location):
+        with self.lock:
+            if rid >= len(self.locations):
+                self.grow(rid + 1)
+            self.locations[rid] = location
+            self.size = max(self.size, rid + 1)
+
+    def __delitem__(self, rid):
+        with self.lock:
+            if rid not in self:
+                raise KeyError(rid)
+            self.locations[rid, 0] = self.TOMBSTONE
+
+    # Doubles the capacity until min_capacity RIDs fit (caller holds the lock)
+    def grow(self, min_capacity):
+        capacity = max(len(self.locations), self.INITIAL_CAPACITY)
+        while capacity < min_capacity:
+            capacity *= 2
+
+        locations = self.create_locations(capacity)
+        locations[:len(self.locations)] = self.locations
+        self.locations = locations
+
+    # Sets the locations of records of one logical page at once, rids[i] is at offset_indexes[i]
+    def set_logical_page_locations(self, rids, page_range_index, record_type, logical_page_index, offset_indexes):
+        with self.lock:
+            max_rid = int(rids.max(initial=0))
+            if max_rid >= len(self.locations):
+                self.grow(max_rid + 1)
+            self.locations[rids, 0] = page_range_index
+            self.locations[rids, 1] = record_type
+            self.locations[rids, 2] = logical_page_index
+            self.locations[rids, 3] = offset_indexes
+            self.size = max(self.size, max_rid + 1)
+
+    # Returns the locations of RIDs [0, size) as one array (what's written to disk)
+    def get_locations(self):
+        with self.lock:
+            return self.locations[:self.size]
+
+    # Builds a page directory from a python dict (RID -> location)
+    @classmethod
+    def from_dict(cls, page_directory_dict):
+        page_directory = cls()
+        for rid, location in page_directory_dict.items():
+            page_directory[rid] = location
+        return page_directory
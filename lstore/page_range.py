@@ -24,18 +24,10 @@ class PageRange:
     def has_capacity(self):
         return self.num_base_records < Config.MAX_RECORDS_PER_PAGE_RANGE
 
-    # Read base/tail record
-    def read_record(self, record_type, logical_page_index, offset_index):
-        logical_page_frame = self.bufferpool.request_logical_page_frame(
-            self.num_columns,
-            self.table_name,
-            self.page_range_index,
-            record_type,
-            logical_page_index
-        )
-        self.bufferpool.pin_frame(logical_page_frame)
-        record = logical_page_frame.logical_page.read_record(offset_index)
-        self.bufferpool.unpin_frame(logical_page_frame)
+    # Read base/tail record, column_indexes limits which columns are read (all columns if None)
+    def read_record(self, record_type, logical_page_index, offset_index, column_indexes=None):
+        with self.pinned_frame(record_type, logical_page_index) as logical_page_frame:
+            record = logical_page_frame.logical_page.read_record(offset_index, column_indexes)
         return record
     
     # Create NEW record (base or tail)
@@ -43,61 +35,41 @@ class PageRange:
         with self.create_record_lock:
             logical_page_index = self.find_free_logical_page(record_type) # Finds free logical page / creates new one
             
-            frame = self.bufferpool.request_logical_page_frame(self.num_columns, self.table_name, self.page_range_index, record_type, logical_page_index)
-            self.bufferpool.pin_frame(frame)
-            frame.dirty = True
-            # Create base/tail record
-            offset_index = frame.logical_page.create_record(record_columns) # Can raise Error
-            self.bufferpool.unpin_frame(frame)
+            with self.pinned_frame(record_type, logical_page_index) as frame:
+                # Create base/tail record
+                offset_index = frame.logical_page.create_record(record_columns) # Can raise Error
+                frame.dirty = True # Set after the change so the background writer can't miss it
+
+            # Counted while holding create_record_lock so the next record goes to the right logical page
+            if record_type == Config.BASE_RECORD:
+                self.num_base_records += 1
+            else:
+                self.num_tail_records += 1
             
             # Return the index of the base/tail page the record was written to and offset index in the base/tail page
             return logical_page_index, offset_index
     
     # Read single column value of a record (RECORD MUST ALREADY EXIST)
     def read_record_column(self, record_type, logical_page_index, offset_index, column_index):
-        logical_page_frame = self.bufferpool.request_logical_page_frame(
-            self.num_columns,
-            self.table_name,
-            self.page_range_index,
-            record_type,
-            logical_page_index
-        )
-        self.bufferpool.pin_frame(logical_page_frame)
-        
-        column_value = logical_page_frame.logical_page.physical_pages[column_index].read(offset_index)
-
-        self.bufferpool.unpin_frame(logical_page_frame)
+        with self.pinned_frame(record_type, logical_page_index) as logical_page_frame:
+            column_value = logical_page_frame.logical_page.get_physical_page(column_index).read(offset_index)
 
         return column_value
 
     # Update single column value of a record to overwrite (RECORD MUST ALREADY EXIST)
     def update_record_column(self, record_type, logical_page_index, offset_index, column_index, column_value):
-        logical_page_frame = self.bufferpool.request_logical_page_frame(
-            self.num_columns,
-            self.table_name,
-            self.page_range_index,
-            record_type,
-            logical_page_index
-        )
-        self.bufferpool.pin_frame(logical_page_frame)
-        logical_page_frame.dirty = True
-
-        logical_page_frame.logical_page.update_record_value(offset_index, column_index, column_value)
-
-        self.bufferpool.unpin_frame(logical_page_frame)
+        with self.pinned_frame(record_type, logical_page_index) as logical_page_frame:
+            logical_page_frame.logical_page.update_record_value(offset_index, column_index, column_value)
+            logical_page_frame.dirty = True
 
     def mark_to_delete_record(self, record_type, logical_page_index, offset_index): # Flag for deletion of record (base or tail), full deletion only happens on merge        
-        logical_page_frame = self.bufferpool.request_logical_page_frame(
-            self.num_columns,
-            self.table_name,
-            self.page_range_index,
-            record_type,
-            logical_page_index
-        )
-        self.bufferpool.pin_frame(logical_page_frame)
-        logical_page_frame.dirty = True
-        logical_page_frame.logical_page.mark_to_delete_record(offset_index)
-        self.bufferpool.unpin_frame(logical_page_frame)
+        with self.pinned_frame(record_type, logical_page_index) as logical_page_frame:
+            logical_page_frame.logical_page.mark_to_delete_record(offset_index)
+            logical_page_frame.dirty = True
+
+    # Pins one of this page range's logical pages in the bufferpool for the duration of the with block
+    def pinned_frame(self, record_type, logical_page_index):
+        return self.bufferpool.pinned(self.num_columns, self.table_name, self.page_range_index, record_type, logical_page_index)
      
     # Iterate through the base pages to find one with space
     # Returns base_page_index if successful, -1 otherwise
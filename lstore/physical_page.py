@@ -1,24 +1,56 @@
+from lstore.config import Config
+
+import numpy as np
+import threading
+
 class PhysicalPage:
 
     PAGE_SIZE = 4096  # 4KB
     RECORD_SIZE = 8    # 64-bit integers (8 bytes)
     MAX_RECORDS = PAGE_SIZE // RECORD_SIZE  # Number of records allowed per page
+    DTYPE = np.dtype('>i8') # Big-endian int64, same byte layout as physical_page.data on disk
+    copy_lock = threading.Lock() # Makes sure concurrent writers copy a memory-mapped page only once
 
     def __init__(self):
         self.num_records = 0 # Initializes number of records stored
         self.data = bytearray(self.PAGE_SIZE) # Sets page size
 
+    # Setting data (also done by disk.py when loading) rebuilds the int64 view over the buffer
+    # data is a bytearray, or a read-only memoryview into a memory-mapped segment file (copied on the first write)
+    @property
+    def data(self):
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        # values is set first, a writer that sees the new data also sees its view
+        self.values = np.frombuffer(data, dtype=self.DTYPE) if Config.NUMPY_PHYSICAL_PAGES else None
+        self._data = data
+
+    # Copies a memory-mapped page into its own buffer before it's changed
+    def make_writable(self):
+        if isinstance(self._data, memoryview):
+            with self.copy_lock:
+                if isinstance(self._data, memoryview):
+                    self.data = bytearray(self._data)
+
     # def has_capacity(self):
     #     return self.num_records < self.MAX_RECORDS
-    
+
     def read(self, offset_index):
         if offset_index >= self.num_records | offset_index < 0:
             raise IndexError("Index is out of bounds, please enter a valid index.")
-        
+
+        if self.values is not None:
+            return int(self.values[offset_index])
+
         offset = offset_index * self.RECORD_SIZE
         return int.from_bytes(self.data[offset: (offset + self.RECORD_SIZE)], byteorder='big')
-    
+
     def read_all(self):
+        if self.values is not None:
+            return self.values[:self.num_records].tolist()
+
         offset = 0
         record_data = []
         for _ in range(self.num_records):
@@ -26,6 +58,20 @@ class PhysicalPage:
             offset += self.RECORD_SIZE
         return record_data
 
+    # Returns the values in [start_index, end_index) as a native int64 numpy array (copy, safe to keep)
+    def read_array(self, start_index=0, end_index=None):
+        if end_index is None:
+            end_index = self.num_records
+        if start_index < 0 or end_index > self.num_records or start_index > end_index:
+            raise IndexError("Index is out of bounds, please enter a valid index.")
+
+        if self.values is not None:
+            return self.values[start_index:end_index].astype(np.int64)
+
+        start = start_index * self.RECORD_SIZE
+        end = end_index * self.RECORD_SIZE
+        return np.frombuffer(bytes(self.data[start:end]), dtype=self.DTYPE).astype(np.int64)
+
     def create(self, value):
         offset_index = self.num_records
 
@@ -38,7 +84,31 @@ class PhysicalPage:
         if not (-2**63 <= value < 2**63): # Checks to see if value lies outside size of 64 bit integer
             raise ValueError("Value is larger than 64 bit int can store.")
 
-        # self.data[offset_index : (offset_index + self.RECORD_SIZE)] = bytearray(self.RECORD_SIZE) 
+        self.make_writable()
+        if self.values is not None:
+            self.values[offset_index] = value
+            return
+
+        # self.data[offset_index : (offset_index + self.RECORD_SIZE)] = bytearray(self.RECORD_SIZE)
         start_index = offset_index*self.RECORD_SIZE
         value_bytes = value.to_bytes(self.RECORD_SIZE, byteorder='big') # Convert value to bytes (big-endian format)
-        self.data[start_index : (start_index + self.RECORD_SIZE)] = value_bytes
\ No newline at end of file
+        self.data[start_index : (start_index + self.RECORD_SIZE)] = value_bytes
+
+    # Overwrites consecutive values starting at offset_index in a single write
+    def update_values(self, offset_index, values):
+        try:
+            values_array = np.asarray(values, dtype=np.int64)
+        except OverflowError:
+            raise ValueError("Value is larger than 64 bit int can store.")
+
+        end_index = offset_index + len(values_array)
+        if offset_index < 0 or end_index > self.MAX_RECORDS:
+            raise IndexError("Index is out of bounds, please enter a valid index.")
+
+        self.make_writable()
+        if self.values is not None:
+            self.values[offset_index:end_index] = values_array
+            return
+
+        start = offset_index * self.RECORD_SIZE
+        self.data[start : (end_index * self.RECORD_SIZE)] = values_array.astype(self.DTYPE).tobytes()
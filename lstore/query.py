@@ -73,11 +73,9 @@ class Query:
     """
     def select_version(self, search_key, search_key_index, projected_columns_index, relative_version):
         rid_list = self.table.index.locate(search_key_index, search_key) # base rids
-        
-        record_list = [self.table.read_record(rid) for rid in rid_list]        
-        record_list = self.get_record_list_lineage(record_list, relative_version)
-        
-        return self.filter_by_projected_columns(record_list, projected_columns_index)
+
+        # Only the projected columns of the requested version are read from the pages
+        return [self.table.read_record(self.get_version_rid(rid, relative_version), projected_columns_index=projected_columns_index) for rid in rid_list]
     
     """
     :param start_range: int         # Start of the key range to aggregate 
@@ -105,19 +103,13 @@ class Query:
         if len(rid_list) == 0:
             return False
 
-        record_list = []
-        for rid in rid_list:
-            record = self.table.read_record(rid)
-            record_list.append(record)
-        
-        record_list = self.get_record_list_lineage(record_list, relative_version)
-        if record_list is False:
-            return False
-        
+        projected_columns_index = [1 if column_index == aggregate_column_index else 0 for column_index in range(self.table.num_columns)]
+
         sum_value = 0
-        for record in record_list:
-            sum_value += record.columns[aggregate_column_index]
-            
+        for rid in rid_list:
+            record = self.table.read_record(self.get_version_rid(rid, relative_version), projected_columns_index=projected_columns_index)
+            sum_value += record.columns[0]
+
         return sum_value
 
     
@@ -140,32 +132,16 @@ class Query:
         # return False
         pass
 
-    def get_record_list_lineage(self, record_list, relative_version):
-        new_record_list = list(record_list)
-
-        for i, record in enumerate(record_list):
-            base_rid = record.rid
-            current_version = 0
-            current_rid = self.table.get_next_lineage_rid(Config.BASE_RECORD, record.rid) # Latest version (version 0)
-
-            while current_version > relative_version and current_rid != base_rid:
-                current_rid = self.table.get_next_lineage_rid(Config.TAIL_RECORD, current_rid)
-                current_version -= 1
-
-            record_type = Config.BASE_RECORD if current_rid == base_rid else Config.TAIL_RECORD
-            new_record_list[i] = self.table.read_record(current_rid)
-
-        return new_record_list
+    # Returns the rid of the given relative version of a base record (0 is the latest version)
+    def get_version_rid(self, base_rid, relative_version):
+        current_version = 0
+        current_rid = self.table.get_next_lineage_rid(Config.BASE_RECORD, base_rid) # Latest version (version 0)
 
+        while current_version > relative_version and current_rid != base_rid:
+            current_rid = self.table.get_next_lineage_rid(Config.TAIL_RECORD, current_rid)
+            current_version -= 1
 
-    def filter_by_projected_columns(self, record_list, projected_columns_index):
-        for record in record_list:
-            columns_result = []
-            for column_index, should_return_column in enumerate(projected_columns_index):
-                if should_return_column == 1:
-                    columns_result.append(record.columns[column_index])
-            record.columns = columns_result
-        return record_list
+        return current_rid
 
 
     """
@@ -0,0 +1,79 @@
+from lstore.config import Config
+
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+"""
+Sequential read-ahead for the bufferpool
+
+Range scans (sum, max, min, avg over insert-ordered keys) request consecutive logical pages of a page range.
+Each (table_name, page_range_index, record_type) is a stream, once a stream requested Config.READ_AHEAD_TRIGGER
+consecutive logical pages the next Config.READ_AHEAD_PAGES pages are loaded on a background thread pool
+so the scan finds them in memory instead of waiting on disk.
+Every bufferpool request is recorded, so there is no global lock: each stream has its own lock
+and requests for the page a stream is already on return without taking it.
+"""
+
+class ReadAhead():
+    def __init__(self, bufferpool):
+        self.bufferpool = bufferpool
+        self.executor = ThreadPoolExecutor(max_workers=Config.READ_AHEAD_WORKERS, thread_name_prefix="read_ahead")
+        self.streams = {} # Maps (table_name, page_range_index, record_type) to its ReadAheadStream (dict.setdefault is atomic)
+        self.running = True
+
+    # Called by the bufferpool for every requested frame
+    def record_access(self, num_columns, frame):
+        location = frame.location
+        stream_key = location[:3] # table_name, page_range_index, record_type
+        logical_page_index = location[3]
+
+        stream = self.streams.get(stream_key)
+        if stream is None:
+            stream = self.streams.setdefault(stream_key, ReadAheadStream())
+        elif logical_page_index == stream.last_logical_page_index: # Same page as last time, nothing new (checked again under the lock)
+            return
+
+        with stream.lock:
+            if logical_page_index == stream.last_logical_page_index:
+                return
+
+            if logical_page_index == stream.last_logical_page_index + 1:
+                stream.num_sequential += 1
+            else:
+                stream.num_sequential = 0
+                stream.prefetched_until = logical_page_index
+
+            # The previous page's loaded columns are the ones the scan reads
+            column_indexes = stream.last_frame.get_loaded_column_indexes() if stream.last_frame is not None else []
+            stream.last_logical_page_index = logical_page_index
+            stream.last_frame = frame
+
+            if stream.num_sequential < Config.READ_AHEAD_TRIGGER or not self.running:
+                return
+
+            first_logical_page_index = max(stream.prefetched_until, logical_page_index) + 1
+            last_logical_page_index = logical_page_index + Config.READ_AHEAD_PAGES
+            stream.prefetched_until = max(stream.prefetched_until, last_logical_page_index)
+
+        for prefetch_logical_page_index in range(first_logical_page_index, last_logical_page_index + 1):
+            location = stream_key + (prefetch_logical_page_index,)
+            self.executor.submit(self.prefetch, num_columns, location, column_indexes)
+
+    def prefetch(self, num_columns, location, column_indexes):
+        if not self.running: # Queued before stop(), skipped so closing the db doesn't wait for it
+            return
+        self.bufferpool.prefetch_logical_page_frame(num_columns, location, column_indexes)
+
+    def stop(self):
+        self.running = False
+        self.executor.shutdown(wait=True)
+
+
+# Access state of one (table_name, page_range_index, record_type)
+class ReadAheadStream():
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.last_logical_page_index = -2 # So the first access isn't counted as sequential
+        self.last_frame = None
+        self.num_sequential = 0 # Number of consecutive logical pages requested in a row
+        self.prefetched_until = -1 # Highest logical page index already submitted for prefetching
@@ -0,0 +1,81 @@
+import threading
+
+"""
+Reader-writer latch (short-term, blocking), used by index.py to guard each column's tree
+Many readers can hold it at once, a writer holds it alone. Waiting writers block new readers so a steady stream of selects can't starve them.
+Not to be confused with lock.py, the transactions' no-wait record locks.
+
+Inserts and updates take it for every column, so it's kept cheap: read() and write() return reusable guards
+(no generator per use) and the condition is only notified when a thread waits on it.
+"""
+
+class ReadWriteLatch():
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cond = threading.Condition(self.lock)
+        self.num_readers = 0
+        self.num_waiting_readers = 0
+        self.num_waiting_writers = 0
+        self.writing = False
+        self.read_guard = ReadGuard(self)
+        self.write_guard = WriteGuard(self)
+
+    def read(self):
+        """ with latch.read(): """
+        return self.read_guard
+
+    def write(self):
+        """ with latch.write(): """
+        return self.write_guard
+
+    def acquire_read(self):
+        with self.lock:
+            if self.writing or self.num_waiting_writers > 0:
+                self.num_waiting_readers += 1
+                while self.writing or self.num_waiting_writers > 0:
+                    self.cond.wait()
+                self.num_waiting_readers -= 1
+            self.num_readers += 1
+
+    def release_read(self):
+        with self.lock:
+            self.num_readers -= 1
+            if self.num_readers == 0 and self.num_waiting_writers > 0:
+                self.cond.notify_all()
+
+    def acquire_write(self):
+        with self.lock:
+            if self.writing or self.num_readers > 0:
+                self.num_waiting_writers += 1
+                while self.writing or self.num_readers > 0:
+                    self.cond.wait()
+                self.num_waiting_writers -= 1
+            self.writing = True
+
+    def release_write(self):
+        with self.lock:
+            self.writing = False
+            if self.num_waiting_writers > 0 or self.num_waiting_readers > 0:
+                self.cond.notify_all()
+
+
+class ReadGuard():
+    def __init__(self, latch):
+        self.latch = latch
+
+    def __enter__(self):
+        self.latch.acquire_read()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.latch.release_read()
+
+
+class WriteGuard():
+    def __init__(self, latch):
+        self.latch = latch
+
+    def __enter__(self):
+        self.latch.acquire_write()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.latch.release_write()
@@ -0,0 +1,126 @@
+from lstore.config import Config
+from lstore.physical_page import PhysicalPage
+from lstore.binary_header import BinaryHeader
+
+import mmap
+import os
+import threading
+
+"""
+Segment file, holds every logical page of one side (base or tail) of a page range
+
+Layout (every block is PhysicalPage.PAGE_SIZE bytes, so slots stay page aligned):
+- Segment header: record_type, num_columns (includes meta columns)
+- Logical page i at a fixed offset: 1 header block (num_records) followed by num_columns physical page blocks
+Both headers are BinaryHeaders (magic, format version, fields, checksum)
+
+Logical pages are read and written in place with os.pread/os.pwrite on a file descriptor kept open until close().
+A logical page that was never written reads back as missing (a hole of zeros, or past the end of the file).
+
+With Config.MMAP_PHYSICAL_PAGES the file is memory-mapped read-only and physical pages are memoryview slices of the mapping,
+so reading a page doesn't copy it (and processes opening the same db share the OS page cache). A page is only copied when it's changed.
+The file is mapped again once it grows past the mapping, the old mappings stay alive as long as pages still reference them.
+"""
+
+class SegmentFile():
+    HEADER = BinaryHeader(b"LSEG", 1, "HI") # record_type, num_columns
+    LOGICAL_PAGE_HEADER = BinaryHeader(b"LPAG", 1, "I") # num_records
+    BLOCK_SIZE = PhysicalPage.PAGE_SIZE
+
+    def __init__(self, path, fd, record_type, num_columns):
+        self.path = path
+        self.fd = fd
+        self.record_type = record_type
+        self.num_columns = num_columns
+        self.logical_page_size = (1 + num_columns) * self.BLOCK_SIZE # Header block + physical pages
+        self.mapping = None # Read-only mmap of the file (Config.MMAP_PHYSICAL_PAGES)
+        self.mapping_lock = threading.Lock()
+
+    # Opens an existing segment file, returns None if it doesn't exist
+    @classmethod
+    def open(cls, path):
+        if not os.path.exists(path):
+            return None
+
+        try:
+            fd = os.open(path, os.O_RDWR)
+        except PermissionError: # Read-only db, pages can still be read
+            fd = os.open(path, os.O_RDONLY)
+        try:
+            record_type, num_columns = cls.HEADER.unpack(os.pread(fd, cls.HEADER.size, 0))
+        except ValueError as e:
+            os.close(fd)
+            raise ValueError(f"Segment file {path}: {e}")
+        return cls(path, fd, record_type, num_columns)
+
+    # Creates a new (empty) segment file
+    @classmethod
+    def create(cls, path, record_type, num_columns):
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        header = cls.HEADER.pack(record_type, num_columns)
+        os.pwrite(fd, header.ljust(cls.BLOCK_SIZE, b"\0"), 0)
+        return cls(path, fd, record_type, num_columns)
+
+    def get_logical_page_offset(self, logical_page_index):
+        return self.BLOCK_SIZE + logical_page_index * self.logical_page_size
+
+    def get_physical_page_offset(self, logical_page_index, column_index):
+        return self.get_logical_page_offset(logical_page_index) + (1 + column_index) * self.BLOCK_SIZE
+
+    # Returns the number of records of the logical page, None if it was never written
+    def read_num_records(self, logical_page_index):
+        header = os.pread(self.fd, self.LOGICAL_PAGE_HEADER.size, self.get_logical_page_offset(logical_page_index))
+        if len(header) < self.LOGICAL_PAGE_HEADER.size or header[:4] != self.LOGICAL_PAGE_HEADER.magic:
+            return None
+
+        try:
+            (num_records,) = self.LOGICAL_PAGE_HEADER.unpack(header)
+        except ValueError as e:
+            raise ValueError(f"Logical page {logical_page_index} in {self.path}: {e}")
+        return num_records
+
+    def read_physical_page(self, logical_page_index, column_index, num_records):
+        offset = self.get_physical_page_offset(logical_page_index, column_index)
+        if Config.MMAP_PHYSICAL_PAGES:
+            data = self.get_mapped_block(offset)
+        else:
+            data = os.pread(self.fd, self.BLOCK_SIZE, offset)
+        if data is None or len(data) < self.BLOCK_SIZE:
+            raise FileNotFoundError(f"Physical page {column_index} of logical page {logical_page_index} is missing in {self.path}")
+
+        physical_page = PhysicalPage()
+        physical_page.num_records = num_records
+        physical_page.data = data if Config.MMAP_PHYSICAL_PAGES else bytearray(data)
+        return physical_page
+
+    # Returns a read-only memoryview of the block at offset, None if it's past the end of the file
+    def get_mapped_block(self, offset):
+        end = offset + self.BLOCK_SIZE
+        with self.mapping_lock:
+            if self.mapping is None or len(self.mapping) < end:
+                if os.fstat(self.fd).st_size < end:
+                    return None
+                self.mapping = mmap.mmap(self.fd, 0, access=mmap.ACCESS_READ) # Maps the whole file
+            return memoryview(self.mapping)[offset:end]
+
+    # Writes the logical page's dirty ranges (maps column_index to [start, end) offset indexes), then its header
+    # (a page only counts as written once its header is). Returns the number of bytes written
+    def write_logical_page(self, logical_page_index, logical_page, dirty_ranges):
+        num_bytes_written = 0
+        for column_index, (start_offset_index, end_offset_index) in dirty_ranges.items():
+            physical_page = logical_page.physical_pages[column_index]
+            start = start_offset_index * PhysicalPage.RECORD_SIZE
+            end = end_offset_index * PhysicalPage.RECORD_SIZE
+            num_bytes_written += os.pwrite(self.fd, memoryview(physical_page.data)[start:end], self.get_physical_page_offset(logical_page_index, column_index) + start)
+
+        header = self.LOGICAL_PAGE_HEADER.pack(logical_page.num_records)
+        num_bytes_written += os.pwrite(self.fd, header, self.get_logical_page_offset(logical_page_index))
+        return num_bytes_written
+
+    # Flushes the file's writes to the disk
+    def sync(self):
+        os.fsync(self.fd)
+
+    def close(self):
+        self.mapping = None # Not closed, pages loaded from it may still be in use
+        os.close(self.fd)
@@ -5,8 +5,10 @@ from lstore.page_range import PageRange
 from lstore.logical_page import LogicalPage
 from lstore.physical_page import PhysicalPage
 from lstore.lockmanager import LockManager
+from lstore.page_directory import PageDirectory
 
 from time import time
+import numpy as np
 import threading
 import copy
 
@@ -31,7 +33,7 @@ class Table:
         self.bufferpool = bufferpool
         
         # Maps RID -> (page_range_index, record_type, logical_page-index, offset_index)
-        self.page_directory = {}
+        self.page_directory = PageDirectory()
 
         self.index = Index(self) # Index has a lock
         
@@ -53,24 +55,41 @@ class Table:
 
     # Reads base/tail record (includes meta-columns)
     # rid starts at 1 as defined above
-    def read_record(self, rid, include_metacolumns=False):
+    # projected_columns_index (array of 1 or 0 values) limits the data columns read from the pages, record.columns then only holds the projected columns
+    def read_record(self, rid, include_metacolumns=False, projected_columns_index=None):
         if rid not in self.page_directory:
             return False # Invalid base record rid
-    
+
+        if projected_columns_index is not None:
+            return self.__read_projected_record(rid, include_metacolumns, projected_columns_index)
+
         page_range_index, record_type, logical_page_index, offset_index = self.page_directory[rid]
-        
+
         record_columns = self.page_ranges[page_range_index].read_record(record_type, logical_page_index, offset_index)
         
         record_metadata = record_columns[:Config.NUM_META_COLUMNS]
         record_data = record_columns[Config.NUM_META_COLUMNS:]
         
         if include_metacolumns:
-            record = Record(rid, record_columns[self.key], record_metadata + record_data)
+            record = Record(rid, record_data[self.key], record_metadata + record_data)
         else:
-            record = Record(rid, record_columns[self.key], record_data)
+            record = Record(rid, record_data[self.key], record_data)
         
         return record
 
+    # Reads only the projected data columns (plus the key column and optionally the meta-columns) of a record
+    def __read_projected_record(self, rid, include_metacolumns, projected_columns_index):
+        page_range_index, record_type, logical_page_index, offset_index = self.page_directory[rid]
+
+        data_column_indexes = [Config.NUM_META_COLUMNS + nonmeta_column_index for nonmeta_column_index, should_return_column in enumerate(projected_columns_index) if should_return_column == 1]
+        key_column_index = Config.NUM_META_COLUMNS + self.key
+        meta_column_indexes = list(range(Config.NUM_META_COLUMNS)) if include_metacolumns else []
+
+        column_indexes = meta_column_indexes + data_column_indexes + [key_column_index]
+        record_columns = self.page_ranges[page_range_index].read_record(record_type, logical_page_index, offset_index, column_indexes)
+
+        return Record(rid, record_columns[-1], record_columns[:-1])
+
     # Creates NEW base record (insert)
     def create_record(self, record_nonmeta_columns):
         if len(record_nonmeta_columns) != self.num_columns or self.index.key_to_rid(self.key, record_nonmeta_columns[self.key]) != -1:
@@ -95,8 +114,6 @@ class Table:
         # Add to index
         self.index.create_index_with_rid(base_rid, record_nonmeta_columns)
 
-        self.page_ranges[page_range_index].num_base_records += 1
-
         return True # Record was created
 
     # Update a record's column value (either creates new tail record or updates existing tail record)
@@ -121,9 +138,7 @@ class Table:
         # Get indirection rid
         latest_rid = self.page_ranges[page_range_index].read_record_column(record_type, base_page_index, base_offset_index, Config.INDIRECTION_COLUMN)
         latest_record_copy =  self.read_record(latest_rid)
-
-        # Delete old key-value index
-        self.index.delete_index_entry(latest_rid, latest_record_copy.columns)
+        old_nonmeta_columns = list(latest_record_copy.columns)
 
         'Create snapshot record if first update to base record'
         if latest_rid == base_rid:
@@ -138,8 +153,6 @@ class Table:
             # Create new tail record and update page directory
             snapshot_logical_page_index, snapshot_offset_index = self.page_ranges[page_range_index].create_record(Config.TAIL_RECORD, snapshot_record_columns)
             self.page_directory[snapshot_tail_rid] = (page_range_index, Config.TAIL_RECORD, snapshot_logical_page_index, snapshot_offset_index)
-            
-            self.page_ranges[page_range_index].num_tail_records += 1
 
         'Create full update record'
         # Allocate RID for latest tail record
@@ -161,10 +174,8 @@ class Table:
         tail_page_index, tail_offset_index = self.page_ranges[page_range_index].create_record(Config.TAIL_RECORD, record_columns)
         self.page_directory[tail_rid] = (page_range_index, Config.TAIL_RECORD, tail_page_index, tail_offset_index)
 
-        self.page_ranges[page_range_index].num_tail_records += 1
-
-        # Create new index entry
-        self.index.create_index_with_rid(base_rid, new_nonmeta_columns)
+        # Move the base record's index entries of the updated columns to their new values
+        self.index.update_index_entry(base_rid, old_nonmeta_columns, record_nonmeta_columns)
 
         # Update base record's indirection column (at the end after the update is complete)
         self.page_ranges[page_range_index].update_record_column(Config.BASE_RECORD, base_page_index, base_offset_index, Config.INDIRECTION_COLUMN, tail_rid)
@@ -181,7 +192,11 @@ class Table:
     
     def rollback_update(self, base_rid, prev_indirection_rid):
         page_range_index, _, base_page_index, base_offset_index = self.page_directory[base_rid]
+        latest_rid = self.page_ranges[page_range_index].read_record_column(Config.BASE_RECORD, base_page_index, base_offset_index, Config.INDIRECTION_COLUMN)
+        updated_nonmeta_columns = self.read_record(latest_rid).columns
         self.page_ranges[page_range_index].update_record_column(Config.BASE_RECORD, base_page_index, base_offset_index, Config.INDIRECTION_COLUMN, prev_indirection_rid)
+        # Move the index entries back to the values of the previous version
+        self.index.update_index_entry(base_rid, updated_nonmeta_columns, self.read_record(prev_indirection_rid).columns)
         # Rollback merging?
     
     '''
@@ -197,8 +212,8 @@ class Table:
         # Get latest existing record
         latest_rid = self.page_ranges[page_range_index].read_record_column(record_type, base_page_index, base_offset_index, Config.INDIRECTION_COLUMN)
         latest_record_copy =  self.read_record(latest_rid)
-        # Delete old key-value index
-        self.index.delete_index_entry(latest_rid, latest_record_copy.columns)
+        # Delete the base record's index entries
+        self.index.delete_index_entry(base_rid, latest_record_copy.columns)
     
         # Delete base record
         self.page_ranges[page_range_index].mark_to_delete_record(Config.BASE_RECORD, base_page_index, base_offset_index)
@@ -223,7 +238,8 @@ class Table:
         page_range_index, record_type, base_page_index, base_offset_index = location
         self.page_ranges[page_range_index].update_record_column(record_type, base_page_index, base_offset_index, Config.INDIRECTION_COLUMN, indirection_rid)
         
-        self.index.create_index_with_rid(base_rid, columns)
+        # delete_record removed the latest version's values from the index (columns are the base record's)
+        self.index.create_index_with_rid(base_rid, self.read_record(indirection_rid).columns)
         return True
 
     '''
@@ -245,12 +261,9 @@ class Table:
                 num_base_pages = ((self.page_ranges[page_range_index].num_base_records - 1) // Config.MAX_RECORDS_PER_LOGICAL_PAGE) + 1
                 for base_page_index in range(num_base_pages):
                     
-                    base_page_frame = self.bufferpool.request_logical_page_frame(self.get_total_columns(), self.name, page_range_index, Config.BASE_RECORD, base_page_index)
-                    
-                    self.bufferpool.pin_frame(base_page_frame)
-                    base_page = base_page_frame.logical_page
-                    base_page_copy = copy.copy(base_page)
-                    self.bufferpool.unpin_frame(base_page_frame)
+                    with self.bufferpool.pinned(self.get_total_columns(), self.name, page_range_index, Config.BASE_RECORD, base_page_index) as base_page_frame:
+                        base_page = base_page_frame.logical_page
+                        base_page_copy = copy.copy(base_page)
 
                     base_pages_copy.append(base_page_copy)
                 
@@ -261,9 +274,13 @@ class Table:
                 #     tail_pages_copy.append(tail_page_copy)
 
                 # Iterates through all records, for only data columns: merge the latest tail record into base record
-                for base_page_copy in base_pages_copy:
-                    base_rids = base_page_copy.physical_pages[Config.RID_COLUMN].read_all()
-                    for base_rid in base_rids:
+                for base_page_index, base_page_copy in enumerate(base_pages_copy):
+                    base_rids = base_page_copy.get_physical_page(Config.RID_COLUMN).read_all()
+                    # Data columns of the base page, the latest values are merged into them and each column is written back at once
+                    merged_data_columns = [base_page_copy.get_physical_page(Config.NUM_META_COLUMNS + column_index).read_all()[:len(base_rids)]
+                                           for column_index in range(self.num_columns)] # self.num_columns is just for data columns
+                    has_updates = False
+                    for offset_index, base_rid in enumerate(base_rids):
                         latest_rid = self.get_next_lineage_rid(Config.BASE_RECORD, base_rid)
                         latest_record_type = Config.BASE_RECORD if latest_rid == base_rid else Config.TAIL_RECORD
                         if latest_record_type == Config.BASE_RECORD:
@@ -275,19 +292,19 @@ class Table:
 
                         # Latest data columns
                         latest_record = self.read_record(latest_rid, include_metacolumns=False)
-                        latest_data_columns = latest_record.columns # New reference obj, can modify
+                        for column_index, new_value in enumerate(latest_record.columns):
+                            merged_data_columns[column_index][offset_index] = new_value
+                        has_updates = True
+
+                    if not has_updates:
+                        continue
 
-                        # Update base record
-                        _, _, base_page_index, offset_index = self.page_directory[base_rid]
-                        base_page_frame = self.bufferpool.request_logical_page_frame(self.get_total_columns(), self.name, page_range_index, Config.BASE_RECORD, base_page_index)
+                    # Update base records
+                    with self.bufferpool.pinned(self.get_total_columns(), self.name, page_range_index, Config.BASE_RECORD, base_page_index) as base_page_frame:
                         base_page = base_page_frame.logical_page
-                        self.bufferpool.pin_frame(base_page_frame)
+                        for column_index, column_values in enumerate(merged_data_columns):
+                            base_page.update_column_values(0, Config.NUM_META_COLUMNS+column_index, column_values)
                         base_page_frame.dirty = True
-                        # Iterate through data columns to update them
-                        for column_index in range(self.num_columns): # self.num_columns is just for data columns
-                            new_value = latest_data_columns[column_index]
-                            base_page.update_record_value(offset_index, Config.NUM_META_COLUMNS+column_index, new_value)
-                        self.bufferpool.unpin_frame(base_page_frame)
 
                         # # Allocate new page range
                         # new_page_range_index = self.find_free_page_range()
@@ -342,6 +359,38 @@ class Table:
         column_value_nonmeta = self.page_ranges[page_range_index].read_record_column(record_type, logical_page_index, offset_index, column_index)
         return column_value_nonmeta
 
+    '''
+    Returns (base_rids, values), numpy arrays of the live base records' RIDs and latest values of a column
+    Base pages are read a whole physical page at a time, only updated records read their latest tail record
+    Used by index.py to build an index and to search columns without one
+    '''
+    def get_latest_column_values(self, nonmeta_column_index):
+        column_index = nonmeta_column_index + Config.NUM_META_COLUMNS
+        base_rids_list = []
+        values_list = []
+        for page_range in list(self.page_ranges):
+            num_base_pages = -(-page_range.num_base_records // Config.MAX_RECORDS_PER_LOGICAL_PAGE)
+            for base_page_index in range(num_base_pages):
+                with page_range.pinned_frame(Config.BASE_RECORD, base_page_index) as base_page_frame:
+                    base_page = base_page_frame.logical_page
+                    base_rids = base_page.get_physical_page(Config.RID_COLUMN).read_array()
+                    indirection_rids = base_page.get_physical_page(Config.INDIRECTION_COLUMN).read_array()[:len(base_rids)]
+                    values = base_page.get_physical_page(column_index).read_array()[:len(base_rids)]
+
+                is_live = indirection_rids != 0 # Deleted records have no indirection
+                base_rids, indirection_rids, values = base_rids[is_live], indirection_rids[is_live], values[is_live]
+                for offset_index in np.flatnonzero(indirection_rids != base_rids): # Updated, the latest tail record holds every column
+                    latest_rid = int(indirection_rids[offset_index])
+                    if latest_rid in self.page_directory:
+                        values[offset_index] = self.get_column_value_nonmeta(latest_rid, nonmeta_column_index)
+
+                base_rids_list.append(base_rids)
+                values_list.append(values)
+
+        if not base_rids_list:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return np.concatenate(base_rids_list), np.concatenate(values_list)
+
     def allocate_rid(self):
         with self.next_rid_lock:
             rid = self.next_rid
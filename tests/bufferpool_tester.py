@@ -0,0 +1,49 @@
+from lstore.db import Database
+from lstore.query import Query
+from lstore.config import Config
+from helper import remove_dir_if_exists
+
+"""
+Checks the bufferpool's pins: flushing a frame that was evicted (and its location reloaded since)
+mustn't release the pin of the frame now at that location
+"""
+
+db_path = "./BUFFERPOOL"
+
+def stale_flush_tester():
+    remove_dir_if_exists(db_path)
+    db = Database()
+    db.open(db_path)
+    test_table = db.create_table('test', 5, 0)
+    query = Query(test_table)
+    for key in range(100):
+        query.insert(key, 1, 2, 3, 4)
+    bufferpool = db.bufferpool
+    num_columns = test_table.get_total_columns()
+    location = ('test', 0, Config.BASE_RECORD, 0)
+    shard = bufferpool.get_shard(location)
+
+    try:
+        # The flusher took the frame from a snapshot of dirty frames, then it was evicted and reloaded
+        stale_frame = bufferpool.request_logical_page_frame(num_columns, *location)
+        stale_frame.dirty = True
+        with shard.latch:
+            bufferpool.write_back_frame(stale_frame)
+            shard.remove_frame(location)
+        frame = bufferpool.request_logical_page_frame(num_columns, *location, pin=True)
+
+        bufferpool.flush_frame(stale_frame)
+        with shard.latch:
+            still_pinned = location in shard.eviction_policy.pinned and shard.eviction_policy.choose_victim() != location
+        bufferpool.unpin_frame(frame)
+        if frame is not stale_frame and frame.pin_count == 0 and still_pinned and stale_frame.pin_count == 0:
+            print("PASS[0]")
+        else:
+            print("Error[0]")
+    except Exception as e:
+        print("Wrong[0]", e)
+
+    db.close()
+    remove_dir_if_exists(db_path)
+
+stale_flush_tester()
@@ -0,0 +1,199 @@
+from lstore.db import Database
+from lstore.query import Query
+from lstore.config import Config
+from lstore.index import Index
+from helper import remove_dir_if_exists
+
+from BTrees.OOBTree import OOBTree
+from random import randint, seed
+import json
+import os
+import pickle
+import sys
+
+"""
+Checks the on-disk formats: a db written in the original layout (pickled json headers, one directory per logical and physical page)
+is migrated to segment files and binary headers when it's opened, page_directory.bin is written and read back,
+and the page directory is rebuilt from the RID columns with Config.PERSIST_PAGE_DIRECTORY = False
+"""
+
+db_path = "./DISK_FORMAT"
+table_name = "Grades"
+num_columns = 5
+number_of_records = 10000 # 2 page ranges
+number_of_updates = 1000
+
+# ----------------------------------------------------------------
+# Writes a db in the original layout, like the first Disk did
+
+def write_legacy_file(path, data, filename):
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, filename), "wb") as f:
+        pickle.dump(json.dumps(data), f) # Pickled json
+
+def write_legacy_logical_page(page_range_path, record_type, logical_page_index, logical_page_records):
+    logical_pages_dir = "base_pages" if record_type == Config.BASE_RECORD else "tail_pages"
+    logical_page_path = os.path.join(page_range_path, logical_pages_dir, str(logical_page_index))
+    write_legacy_file(logical_page_path, {"num_columns": len(logical_page_records[0]), "num_records": len(logical_page_records)}, "header.pkl")
+    for column_index in range(len(logical_page_records[0])):
+        physical_page_path = os.path.join(logical_page_path, "physical_pages", str(column_index))
+        write_legacy_file(physical_page_path, {"num_records": len(logical_page_records)}, "header.pkl")
+        data = bytearray(4096)
+        for offset_index, record in enumerate(logical_page_records):
+            data[offset_index * 8:(offset_index + 1) * 8] = record[column_index].to_bytes(8, byteorder="big", signed=True)
+        with open(os.path.join(physical_page_path, "physical_page.data"), "wb") as f:
+            f.write(data)
+
+# Pickles as the original Index (an OOBTree of RID lists per column)
+class LegacyIndex():
+    def __init__(self, indices):
+        self.indices = indices
+
+    def __reduce__(self):
+        return (object.__new__, (Index,), {"indices": self.indices})
+
+def write_legacy_db(records, updated_records):
+    table_path = os.path.join(db_path, table_name)
+    page_directory = {}
+    indices = [OOBTree() for _ in range(num_columns)]
+    base_pages = {} # Maps page_range_index to its base records (all columns)
+    tail_pages = {}
+    base_rids = {}
+
+    rid = 1
+    for key in sorted(records):
+        page_range_index = (rid - 1) // Config.MAX_RECORDS_PER_PAGE_RANGE
+        page_range_base_records = base_pages.setdefault(page_range_index, [])
+        offset = len(page_range_base_records)
+        page_range_base_records.append([rid, rid, 0, 0, 0] + records[key])
+        page_directory[rid] = (page_range_index, Config.BASE_RECORD, offset // Config.MAX_RECORDS_PER_LOGICAL_PAGE, offset % Config.MAX_RECORDS_PER_LOGICAL_PAGE)
+        base_rids[key] = rid
+        rid += 1
+
+    # Updates: a snapshot of the base record, then the updated record, like Table.update_record
+    for key in sorted(updated_records):
+        base_rid = base_rids[key]
+        page_range_index, _, base_page_index, base_offset_index = page_directory[base_rid]
+        base_record = base_pages[page_range_index][base_page_index * Config.MAX_RECORDS_PER_LOGICAL_PAGE + base_offset_index]
+        page_range_tail_records = tail_pages.setdefault(page_range_index, [])
+        for tail_record in ([base_rid, rid, 0, 0, 0] + records[key], [rid, rid + 1, 0, 1, 0] + updated_records[key]):
+            offset = len(page_range_tail_records)
+            page_range_tail_records.append(tail_record)
+            page_directory[tail_record[Config.RID_COLUMN]] = (page_range_index, Config.TAIL_RECORD, offset // Config.MAX_RECORDS_PER_LOGICAL_PAGE, offset % Config.MAX_RECORDS_PER_LOGICAL_PAGE)
+        base_record[Config.INDIRECTION_COLUMN] = rid + 1
+        base_record[Config.SCHEMA_ENCODING_COLUMN] = 1 << 2 # Column 2 was updated
+        rid += 2
+
+    for key, base_rid in base_rids.items():
+        for column_index, column_value in enumerate(updated_records.get(key, records[key])):
+            indices[column_index].setdefault(column_value, []).append(base_rid)
+
+    write_legacy_file(table_path, {"name": table_name, "key": 0, "num_columns": num_columns, "next_rid": rid}, "header.pkl")
+    write_legacy_file(table_path, page_directory, "page_directory.pkl")
+    recursion_limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(100000) # Pickling a large OOBTree recurses once per bucket
+    try:
+        with open(os.path.join(table_path, "index.pkl"), "wb") as f:
+            pickle.dump(LegacyIndex(indices), f)
+    finally:
+        sys.setrecursionlimit(recursion_limit)
+
+    for page_range_index, page_range_base_records in base_pages.items():
+        page_range_path = os.path.join(table_path, "page_ranges", str(page_range_index))
+        page_range_tail_records = tail_pages.get(page_range_index, [])
+        write_legacy_file(page_range_path, {
+            "table_name": table_name,
+            "page_range_index": page_range_index,
+            "num_columns": num_columns + Config.NUM_META_COLUMNS,
+            "num_base_records": len(page_range_base_records),
+            "num_tail_records": len(page_range_tail_records),
+            "num_updates": len(page_range_tail_records) // 2,
+        }, "header.pkl")
+        for record_type, logical_page_records in ((Config.BASE_RECORD, page_range_base_records), (Config.TAIL_RECORD, page_range_tail_records)):
+            for start in range(0, len(logical_page_records), Config.MAX_RECORDS_PER_LOGICAL_PAGE):
+                write_legacy_logical_page(page_range_path, record_type, start // Config.MAX_RECORDS_PER_LOGICAL_PAGE, logical_page_records[start:start + Config.MAX_RECORDS_PER_LOGICAL_PAGE])
+
+# ----------------------------------------------------------------
+
+def check_records(query, latest_records, test_index):
+    try:
+        num_bad_records = 0
+        for key, record in latest_records.items():
+            result = query.select(key, 0, [1, 1, 1, 1, 1])
+            if len(result) != 1 or result[0].columns != record:
+                num_bad_records += 1
+
+        keys = sorted(latest_records)
+        expected_sum = sum(latest_records[key][2] for key in keys[100:5100])
+        if num_bad_records == 0 and query.sum(keys[100], keys[5099], 2) == expected_sum:
+            print(f"PASS[{test_index}]")
+        else:
+            print(f"Error[{test_index}] {num_bad_records} bad records")
+    except Exception as e:
+        print(f"Wrong[{test_index}] {e}")
+
+def check_files(table_path, expected_files, unexpected_files, test_index):
+    missing_files = [filename for filename in expected_files if not os.path.exists(os.path.join(table_path, filename))]
+    left_files = [filename for filename in unexpected_files if os.path.exists(os.path.join(table_path, filename))]
+    if not missing_files and not left_files:
+        print(f"PASS[{test_index}]")
+    else:
+        print(f"Error[{test_index}] missing {missing_files} left {left_files}")
+
+def disk_format_tester():
+    remove_dir_if_exists(db_path)
+    seed(3562901)
+
+    records = {}
+    for i in range(number_of_records):
+        key = 92106429 + i
+        records[key] = [key, randint(0, 20), randint(0, 20), randint(0, 20), randint(0, 20)]
+    updated_records = {}
+    for key in sorted(records)[::number_of_records // number_of_updates]:
+        updated_records[key] = list(records[key])
+        updated_records[key][2] = randint(0, 20)
+    latest_records = {key: list(updated_records.get(key, record)) for key, record in records.items()}
+    write_legacy_db(records, updated_records)
+    table_path = os.path.join(db_path, table_name)
+
+    # Original layout is migrated when the table is first read
+    db = Database()
+    db.open(db_path)
+    query = Query(db.get_table(table_name))
+    check_records(query, latest_records, 0)
+    for key in sorted(latest_records)[1::7]:
+        value = randint(0, 20)
+        query.update(key, None, None, value, None, None)
+        latest_records[key][2] = value
+    db.close()
+    check_files(table_path, ["header.bin", "page_directory.bin", "page_ranges/0/header.bin", "page_ranges/0/base_pages.seg", "page_ranges/0/tail_pages.seg"],
+                ["header.pkl", "page_directory.pkl", "page_ranges/0/header.pkl", "page_ranges/0/base_pages", "page_ranges/1/tail_pages"], 1)
+
+    # Segment files, binary headers and page_directory.bin read back
+    db = Database()
+    db.open(db_path)
+    query = Query(db.get_table(table_name))
+    check_records(query, latest_records, 2)
+    db.close()
+
+    # Page directory rebuilt from the RID columns
+    persist_page_directory = Config.PERSIST_PAGE_DIRECTORY
+    Config.PERSIST_PAGE_DIRECTORY = False
+    try:
+        db = Database()
+        db.open(db_path)
+        db.get_table(table_name)
+        db.close()
+        check_files(table_path, ["header.bin"], ["page_directory.bin"], 3)
+
+        db = Database()
+        db.open(db_path)
+        query = Query(db.get_table(table_name))
+        check_records(query, latest_records, 4)
+        db.close()
+    finally:
+        Config.PERSIST_PAGE_DIRECTORY = persist_page_directory
+
+    remove_dir_if_exists(db_path)
+
+disk_format_tester()
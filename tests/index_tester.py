@@ -0,0 +1,110 @@
+from lstore.db import Database
+from lstore.query import Query
+from lstore.config import Config
+from helper import remove_dir_if_exists
+
+import threading
+
+"""
+Checks that the index follows deletes, updates and rolled back updates and deletes:
+deleting a record keeps the other records with the same secondary values, an update only moves the columns it changes,
+rollback_update moves the entries back to the previous version's values, rollback_delete indexes the latest version again
+and an insert while create_index builds the column's index ends up in it
+"""
+
+db_path = "./INDEX"
+
+def sorted_rids(table, column, value):
+    return sorted(table.index.locate(column, value))
+
+def index_tester():
+    remove_dir_if_exists(db_path)
+    records = [
+        [0, 1, 1, 2, 1],
+        [1, 1, 1, 1, 2],
+        [2, 0, 3, 5, 1],
+        [3, 1, 5, 1, 3],
+    ]
+    db = Database()
+    db.open(db_path)
+    test_table = db.create_table('test', 5, 0)
+    query = Query(test_table)
+    for record in records:
+        query.insert(*record)
+    test_table.index.create_index(2)
+    test_table.index.create_index(3)
+    rids = [test_table.index.key_to_rid(0, record[0]) for record in records]
+
+    try:
+        # Deleting a record keeps the others with the same value
+        query.delete(0)
+        if sorted_rids(test_table, 2, 1) == [rids[1]] and sorted_rids(test_table, 3, 2) == [] and test_table.index.key_to_rid(0, 0) == -1:
+            print("PASS[0]")
+        else:
+            print("Error[0]")
+    except Exception as e:
+        print("Wrong[0]", e)
+
+    try:
+        # An update only moves the columns it changes
+        query.update(1, None, None, None, 5, None)
+        if sorted_rids(test_table, 2, 1) == [rids[1]] and sorted_rids(test_table, 3, 1) == [rids[3]] and sorted_rids(test_table, 3, 5) == sorted([rids[1], rids[2]]):
+            print("PASS[1]")
+        else:
+            print("Error[1]")
+    except Exception as e:
+        print("Wrong[1]", e)
+
+    try:
+        # A rolled back update moves the entries back
+        prev_indirection_rid = test_table.get_next_lineage_rid(Config.BASE_RECORD, rids[3])
+        query.update(3, None, None, 3, 2, None)
+        test_table.rollback_update(rids[3], prev_indirection_rid)
+        if sorted_rids(test_table, 2, 5) == [rids[3]] and sorted_rids(test_table, 2, 3) == [rids[2]] and sorted_rids(test_table, 3, 1) == [rids[3]] \
+                and sorted_rids(test_table, 3, 2) == [] and query.select(3, 0, [1, 1, 1, 1, 1])[0].columns == records[3]:
+            print("PASS[2]")
+        else:
+            print("Error[2]")
+    except Exception as e:
+        print("Wrong[2]", e)
+
+    try:
+        # A rolled back delete of an updated record indexes its latest values again (what Transaction.abort passes to rollback_delete)
+        query.update(2, None, None, 7, None, None)
+        columns = test_table.read_record(rids[2]).columns
+        location = test_table.page_directory[rids[2]]
+        indirection_rid = test_table.get_next_lineage_rid(Config.BASE_RECORD, rids[2])
+        query.delete(2)
+        test_table.rollback_delete(rids[2], columns, location, indirection_rid)
+        if sorted_rids(test_table, 2, 7) == [rids[2]] and sorted_rids(test_table, 2, 3) == [] and sorted_rids(test_table, 3, 5) == sorted([rids[1], rids[2]]) \
+                and test_table.index.key_to_rid(0, 2) == rids[2] and query.select(2, 0, [1, 1, 1, 1, 1])[0].columns == [2, 0, 7, 5, 1]:
+            print("PASS[3]")
+        else:
+            print("Error[3]")
+    except Exception as e:
+        print("Wrong[3]", e)
+
+    try:
+        # An insert while create_index builds the index waits for it instead of missing it
+        get_latest_column_values = test_table.get_latest_column_values
+        insert_thread = threading.Thread(target=query.insert, args=(4, 2, 7, 1, 9))
+        def get_latest_column_values_during_insert(column):
+            column_values = get_latest_column_values(column) # Read before the insert
+            insert_thread.start()
+            insert_thread.join(0.2) # Blocks on the column's latch until the index is built
+            return column_values
+        test_table.get_latest_column_values = get_latest_column_values_during_insert
+        test_table.index.create_index(4)
+        insert_thread.join()
+        del test_table.get_latest_column_values
+        if sorted_rids(test_table, 4, 9) == [test_table.index.key_to_rid(0, 4)] and sorted_rids(test_table, 4, 1) == [rids[2]]:
+            print("PASS[4]")
+        else:
+            print("Error[4]")
+    except Exception as e:
+        print("Wrong[4]", e)
+
+    db.close()
+    remove_dir_if_exists(db_path)
+
+index_tester()